@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS pages (page INTEGER PRIMARY KEY, book_name INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS page_formulas (page INTEGER, position INTEGER, formula INTEGER,
+                                          PRIMARY KEY (page, position));
+CREATE TABLE IF NOT EXISTS images (image_id TEXT PRIMARY KEY, file_path INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS page_images (page INTEGER, position INTEGER, image_id TEXT,
+                                        PRIMARY KEY (page, position));
+CREATE TABLE IF NOT EXISTS chunks (idx INTEGER PRIMARY KEY, chunk_id TEXT, page INTEGER NOT NULL,
+                                   text INTEGER NOT NULL);
+"""
+
+
+class BookMetadataStore:
+    """
+    Writer for the normalized book metadata file (`<base>_metadata.sqlite`).
+
+    A page's formulas and images are stored once in page tables and chunks
+    only reference their page, instead of every chunk carrying a copy of its
+    page's lists. Chunk texts, formulas, book names and image paths go
+    through a string pool, so repeated strings are stored once as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._pages = {row[0] for row in self.db.execute("SELECT page FROM pages")}
+
+    def add_chunks(self, chunks, start_idx):
+        """Store chunk dicts (as built by BookEmbeddingProcessor) as rows start_idx, start_idx + 1, ..."""
+        with self.db:
+            for idx, chunk in enumerate(chunks, start=start_idx):
+                page = chunk["page"]
+                if page not in self._pages:
+                    self._add_page(page, chunk)
+                self.db.execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                                (idx, chunk["chunk_id"], page, self._string_id(chunk["text"])))
+
+    def truncate(self, num_chunks, pages_done):
+        """Drop chunks from row num_chunks on and pages after pages_done (used when resuming)."""
+        with self.db:
+            self.db.execute("DELETE FROM chunks WHERE idx >= ?", (num_chunks,))
+            for table in ("pages", "page_formulas", "page_images"):
+                self.db.execute(f"DELETE FROM {table} WHERE page > ?", (pages_done,))
+        self._pages = {page for page in self._pages if page <= pages_done}
+
+    def set_book_name(self, book_name):
+        with self.db:
+            self.db.execute("UPDATE pages SET book_name = ?", (self._string_id(book_name),))
+
+    def close(self):
+        self.db.close()
+
+    def _add_page(self, page, chunk):
+        self.db.execute("INSERT INTO pages VALUES (?, ?)", (page, self._string_id(chunk["book_name"])))
+        self.db.executemany("INSERT INTO page_formulas VALUES (?, ?, ?)", [
+            (page, position, self._string_id(formula["formula"]))
+            for position, formula in enumerate(chunk["formulas"])
+        ])
+        for position, image in enumerate(chunk["images"]):
+            self.db.execute("INSERT OR IGNORE INTO images VALUES (?, ?)",
+                            (image["image_id"], self._string_id(image["file_path"])))
+            self.db.execute("INSERT INTO page_images VALUES (?, ?, ?)", (page, position, image["image_id"]))
+        self._pages.add(page)
+
+    def _string_id(self, value):
+        self.db.execute("INSERT OR IGNORE INTO strings (value) VALUES (?)", (value,))
+        return self.db.execute("SELECT id FROM strings WHERE value = ?", (value,)).fetchone()[0]
+
+
+class BookMetadata:
+    """
+    Read-only, lazy view of a `<base>_metadata.sqlite` file. Behaves like the
+    list of chunk dicts the JSON format held (len, indexing, iteration), but
+    each chunk is only assembled when it is looked up.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # as_uri() percent-encodes ?, # and % and yields file:///C:/... on Windows
+        self.db = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+        self._len = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        # Neighbouring chunks share a page, so keep recently used pages' formulas/images around
+        self._page = lru_cache(maxsize=256)(self._load_page)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += self._len
+        row = self.db.execute(
+            "SELECT c.chunk_id, c.page, s.value FROM chunks c JOIN strings s ON s.id = c.text WHERE c.idx = ?",
+            (idx,)
+        ).fetchone()
+        if row is None:
+            raise IndexError(f"chunk {idx} out of range")
+        chunk_id, page, text = row
+        book_name, formulas, images = self._page(page)
+        return {
+            "book_name": book_name,
+            "page": page,
+            "chunk_id": chunk_id,
+            "text": text,
+            "formulas": [{"formula": formula, "page": page} for formula in formulas],
+            "images": [{"file_path": file_path, "page": page, "image_id": image_id} for image_id, file_path in images],
+        }
+
+    def __iter__(self):
+        for idx in range(self._len):
+            yield self[idx]
+
+    def _load_page(self, page):
+        book_name = self.db.execute(
+            "SELECT s.value FROM pages p JOIN strings s ON s.id = p.book_name WHERE p.page = ?", (page,)
+        ).fetchone()[0]
+        formulas = tuple(value for (value,) in self.db.execute(
+            "SELECT s.value FROM page_formulas f JOIN strings s ON s.id = f.formula "
+            "WHERE f.page = ? ORDER BY f.position", (page,)
+        ))
+        images = tuple(self.db.execute(
+            "SELECT i.image_id, s.value FROM page_images pi JOIN images i ON i.image_id = pi.image_id "
+            "JOIN strings s ON s.id = i.file_path WHERE pi.page = ? ORDER BY pi.position", (page,)
+        ))
+        return book_name, formulas, images
+
+    def image_paths(self):
+        """File paths of every distinct image referenced by the book."""
+        return [value for (value,) in self.db.execute(
+            "SELECT s.value FROM images i JOIN strings s ON s.id = i.file_path")]
+
+    def images_on_pages(self, pages):
+        """(image file path, page) for every image on the given pages, in page order."""
+        pages = sorted(set(pages))
+        if not pages:
+            return []
+        rows = self.db.execute(
+            f"SELECT s.value, pi.page FROM page_images pi JOIN images i ON i.image_id = pi.image_id "
+            f"JOIN strings s ON s.id = i.file_path WHERE pi.page IN ({','.join('?' * len(pages))}) "
+            f"ORDER BY pi.page, pi.position", pages
+        )
+        return list(rows)
+
+    def close(self):
+        self.db.close()
+
+
+class JsonBookMetadata(list):
+    """Chunk list loaded from a legacy `<base>_metadata.json`, with the same helpers as BookMetadata."""
+
+    def image_paths(self):
+        return list(dict.fromkeys(image["file_path"] for chunk in self for image in chunk["images"]))
+
+    def images_on_pages(self, pages):
+        pages = set(pages)
+        found = {}
+        for chunk in self:
+            if int(chunk["page"]) in pages:
+                for image in chunk["images"]:
+                    found[(image["file_path"], int(chunk["page"]))] = None
+        return sorted(found, key=lambda item: item[1])
+
+    def close(self):
+        pass
+
+
+def write_book_metadata(base_path, chunks):
+    """Write chunk dicts to `<base>_metadata.sqlite`, replacing any previous file."""
+    path = f"{base_path}_metadata.sqlite"
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    store = BookMetadataStore(tmp_path)
+    store.add_chunks(chunks, 0)
+    store.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_book_metadata(base_path):
+    """Lazy BookMetadata for `<base>_metadata.sqlite`, falling back to a legacy `<base>_metadata.json`."""
+    if os.path.exists(f"{base_path}_metadata.sqlite"):
+        return BookMetadata(f"{base_path}_metadata.sqlite")
+    with open(f"{base_path}_metadata.json", "r", encoding="utf-8") as f:
+        return JsonBookMetadata(json.load(f))
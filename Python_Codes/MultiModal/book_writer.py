@@ -0,0 +1,100 @@
+import json
+import os
+
+import numpy as np
+
+from .book_metadata import BookMetadataStore
+
+
+class StreamingBookWriter:
+    """
+    Writes a book's embeddings and chunk metadata to disk batch by batch, so
+    neither ever has to be held in memory as a whole, and lets an interrupted
+    run pick up after the last completed batch.
+
+    Work files next to `base_path`:
+      _embeddings.f32         raw float32 rows, appended to (a growable on-disk array)
+      _metadata.partial.sqlite  normalized chunk metadata (see BookMetadataStore)
+      _progress.json          {"key", "pages_done", "chunks", "dim"}, replaced
+                              atomically after every batch
+
+    finish() turns them into the usual `_embeddings.npy` / `_metadata.sqlite`
+    pair read by load_book_embeddings and removes the work files.
+    """
+
+    def __init__(self, base_path, key):
+        self.base_path = base_path
+        self.key = key
+        self.embeddings_path = f"{base_path}_embeddings.f32"
+        self.metadata_path = f"{base_path}_metadata.partial.sqlite"
+        self.progress_path = f"{base_path}_progress.json"
+        self.pages_done = 0
+        self.chunks = 0
+        self.dim = None
+        self.store = None
+
+    def resume(self):
+        """Restore the last completed batch of a run over the same book; returns the number of pages done."""
+        progress = None
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, "r", encoding="utf-8") as f:
+                progress = json.load(f)
+        work_files = (self.embeddings_path, self.metadata_path)
+        if (progress is None or progress["key"] != self.key
+                or (progress["chunks"] and not all(os.path.exists(path) for path in work_files))):
+            self._remove_work_files()
+            self.store = BookMetadataStore(self.metadata_path)
+            return 0
+
+        self.pages_done, self.chunks, self.dim = progress["pages_done"], progress["chunks"], progress["dim"]
+        self.store = BookMetadataStore(self.metadata_path)
+        # Drop anything a crash left behind after the last recorded batch
+        self.store.truncate(self.chunks, self.pages_done)
+        if self.chunks:
+            with open(self.embeddings_path, "r+b") as f:
+                f.truncate(self.chunks * (self.dim or 0) * 4)
+        return self.pages_done
+
+    def append(self, chunks, embeddings, pages_done):
+        """Append one batch of chunks with their embeddings, then record that `pages_done` pages are complete."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(chunks):
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            with open(self.embeddings_path, "ab") as f:
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.store.add_chunks(chunks, self.chunks)
+        self.chunks += len(chunks)
+        self.pages_done = pages_done
+        self._save_progress()
+
+    def finish(self, block_rows=65536):
+        """Write the final .npy / .sqlite pair from the work files and remove them."""
+        dim = self.dim or 0
+        out = np.lib.format.open_memmap(f"{self.base_path}_embeddings.npy", mode="w+",
+                                        dtype=np.float32, shape=(self.chunks, dim))
+        if self.chunks and dim:
+            rows = np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(self.chunks, dim))
+            for start in range(0, self.chunks, block_rows):
+                out[start:start + block_rows] = rows[start:start + block_rows]
+            del rows
+        out.flush()
+        del out
+
+        self.store.close()
+        self.store = None
+        os.replace(self.metadata_path, f"{self.base_path}_metadata.sqlite")
+        self._remove_work_files()
+
+    def _save_progress(self):
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "pages_done": self.pages_done, "chunks": self.chunks, "dim": self.dim}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def _remove_work_files(self):
+        for path in (self.embeddings_path, self.metadata_path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+
+class BookEmbeddingCache:
+    """
+    Persistent, content-addressed cache for book embeddings, in two levels:
+
+    - book: key = hash(PDF bytes, chunking parameters, model name, extraction
+      format) -> a saved copy of the finished embeddings + metadata, so
+      re-running the same book costs no extraction or embedding at all.
+    - chunk: key = (model name, hash(chunk text)) -> embedding, so an edited
+      PDF only re-embeds the chunks whose text actually changed.
+
+    Both levels live in one SQLite file under `cache_dir`; hits and misses are
+    counted in `stats`.
+    """
+
+    def __init__(self, cache_dir="book_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite"))
+        self.db.execute("CREATE TABLE IF NOT EXISTS books (key TEXT PRIMARY KEY, book_name TEXT, num_chunks INTEGER)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "model TEXT, text_hash TEXT, embedding BLOB, PRIMARY KEY (model, text_hash))"
+        )
+        self.db.commit()
+        self.stats = {"book_hits": 0, "book_misses": 0, "chunk_hits": 0, "chunk_misses": 0}
+
+    @staticmethod
+    def file_hash(path, block_size=1 << 20):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def book_key(pdf_hash, chunk_size, chunk_overlap, model_name, extraction_format=1):
+        """Book-level key from the PDF's file_hash() and everything else that changes the stored output."""
+        params = json.dumps([pdf_hash, chunk_size, chunk_overlap, model_name, extraction_format])
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+    def book_path(self, key):
+        """Base path (as used by save/load_book_embeddings) of a cached book's files."""
+        return os.path.join(self.cache_dir, key)
+
+    # ---------------- BOOK LEVEL ----------------
+    def get_book(self, key):
+        """Return the cached book's base path, or None if it is not cached (or its files are gone)."""
+        row = self.db.execute("SELECT key FROM books WHERE key = ?", (key,)).fetchone()
+        base_path = self.book_path(key)
+        if row is None or not (os.path.exists(f"{base_path}_embeddings.npy")
+                               and os.path.exists(f"{base_path}_metadata.sqlite")):
+            self.stats["book_misses"] += 1
+            return None
+        self.stats["book_hits"] += 1
+        return base_path
+
+    def put_book(self, key, book_name, num_chunks):
+        self.db.execute("INSERT OR REPLACE INTO books VALUES (?, ?, ?)", (key, book_name, num_chunks))
+        self.db.commit()
+
+    # ---------------- CHUNK LEVEL ----------------
+    def get_embeddings(self, model_name, text_hashes, batch_size=500):
+        """Return {text_hash: embedding} for the hashes that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(text_hashes))
+        for start in range(0, len(unique), batch_size):
+            batch = unique[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.db.execute(
+                f"SELECT text_hash, embedding FROM chunks WHERE model = ? AND text_hash IN ({placeholders})",
+                [model_name, *batch]
+            )
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        hits = sum(1 for h in text_hashes if h in found)
+        self.stats["chunk_hits"] += hits
+        self.stats["chunk_misses"] += len(text_hashes) - hits
+        return found
+
+    def put_embeddings(self, model_name, text_hashes, embeddings):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+            [(model_name, h, np.asarray(e, dtype=np.float32).tobytes()) for h, e in zip(text_hashes, embeddings)]
+        )
+        self.db.commit()
+
+    def report(self):
+        print(f"📦 Book cache: {self.stats['book_hits']} book hits, {self.stats['book_misses']} misses; "
+              f"{self.stats['chunk_hits']} chunk hits, {self.stats['chunk_misses']} misses")
+
+    def close(self):
+        self.db.close()
@@ -28,9 +28,13 @@ class LectureBookMatcher:
         print(f"   (Each segment = {self.embeddings_per_segment} × {seconds_per_embedding}s = {self.segment_duration_seconds}s)")
 
     def load_book_database(self, book_embeddings_path):
-        """Load book embeddings from file"""
-        processor = BookEmbeddingProcessor()
-        book_embeddings, book_metadata = processor.load_book_embeddings(book_embeddings_path)
+        """Load book embeddings from file (the embedding model itself is never loaded here)"""
+        # No cache: the matcher only reads saved embeddings, so it has no use for the cache database
+        processor = BookEmbeddingProcessor(cache_dir=None)
+        try:
+            book_embeddings, book_metadata = processor.load_book_embeddings(book_embeddings_path)
+        finally:
+            processor.close()
         self.book_embeddings = normalize(book_embeddings, axis=1)
         self.book_metadata = book_metadata
         print(f"✅ Loaded {len(self.book_embeddings)} book chunks")
@@ -1,102 +1,284 @@
 import os
 import re
 import fitz  # PyMuPDF
-import json
+import multiprocessing
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from model_registry import registry
+from pipeline_functions import clean_directory
+from .book_metadata import BookMetadataStore, load_book_metadata, write_book_metadata
+from .book_writer import StreamingBookWriter
+from .embedding_cache import BookEmbeddingCache
+from .pdf_extraction import EXTRACTION_FORMAT, extract_formulas, extract_page_range
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import torch
 
 
 class BookEmbeddingProcessor:
-    def __init__(self, embedding_model_name="all-MiniLM-L6-v2"):
+    def __init__(self, embedding_model_name="all-MiniLM-L6-v2", chunk_size=500, chunk_overlap=50,
+                 cache_dir="book_cache", extract_workers=1):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"🔥 Using device: {self.device}")
-        self.embedding_model = SentenceTransformer(embedding_model_name, device=self.device)
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len)
+        self.embedding_model_name = embedding_model_name
+        self._embedding_model = None
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
+        # Pass cache_dir=None to always re-extract and re-embed
+        self.cache = BookEmbeddingCache(cache_dir) if cache_dir else None
+        # Processes used for page extraction; each opens its own fitz Document
+        self.extract_workers = extract_workers
+
+    @property
+    def embedding_model(self):
+        """Shared embedding model, only acquired from the registry when first needed."""
+        if self._embedding_model is None:
+            self._embedding_model = registry.acquire("sentence-transformer", self.embedding_model_name, self.device)
+        return self._embedding_model
+
+    def close(self):
+        if self._embedding_model is not None:
+            registry.release("sentence-transformer", self.embedding_model_name, self.device)
+            self._embedding_model = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
 
     # ---------------- IMAGE + FORMULA + TEXT EXTRACTION ----------------
-    def extract_text_images_formulas(self, pdf_path, output_dir="output"):
-        image_output_dir = os.path.join(output_dir, "book_images")
+    @staticmethod
+    def book_image_dir(output_dir, pdf_hash):
+        """Each book (by PDF hash) gets its own image folder, so one book's extraction never touches another's."""
+        return os.path.join(output_dir, "book_images", pdf_hash[:16])
+
+    def extract_text_images_formulas(self, pdf_path, output_dir="output", image_output_dir=None):
+        if image_output_dir is None:
+            image_output_dir = os.path.join(output_dir, "book_images")
         os.makedirs(image_output_dir, exist_ok=True)
-        doc = fitz.open(pdf_path)
-        pages_data = []
-
-        print(f"📖 Extracting text, images, and formulas from {len(doc)} pages...")
-
-        for page_index in range(len(doc)):
-            page = doc.load_page(page_index)
-            text = page.get_text("text")
-            formulas = self._extract_formulas(text)
-            image_paths = []
-
-            # Extract images with page linkage
-            for image_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                img_filename = f"page_{page_index+1}img{image_index+1}.{image_ext}"
-                img_path = os.path.join(image_output_dir, img_filename)
-                with open(img_path, "wb") as f:
-                    f.write(image_bytes)
-                image_paths.append({
-                    "file_path": img_path,
-                    "page": page_index + 1,
-                    "image_id": f"{page_index+1}_{image_index+1}"
-                })
-
-            pages_data.append({
-                "page": page_index + 1,
-                "text": text,
-                "formulas": [{"formula": f, "page": page_index + 1} for f in formulas],
-                "images": image_paths
-            })
+        with fitz.open(pdf_path) as doc:
+            num_pages = len(doc)
 
+        workers = min(self.extract_workers, num_pages)
+        print(f"📖 Extracting text, images, and formulas from {num_pages} pages"
+              f"{f' with {workers} processes' if workers > 1 else ''}...")
+
+        if workers <= 1:
+            results = [extract_page_range(pdf_path, image_output_dir, 0, num_pages)]
+        else:
+            # Several ranges per worker so one image-heavy range doesn't hold up the rest
+            range_size = max(1, -(-num_pages // (workers * 4)))
+            ranges = [(start, min(start + range_size, num_pages)) for start in range(0, num_pages, range_size)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(extract_page_range, pdf_path, image_output_dir, start, stop)
+                           for start, stop in ranges]
+                results = [future.result() for future in futures]
+
+        # Merge in submission order, i.e. page order
+        pages_data = [page for page_range, _ in results for page in page_range]
+        image_stats = {key: sum(stats[key] for _, stats in results) for key in results[0][1]}
         print(f"✅ Extracted {len(pages_data)} pages with linked images & formulas.")
+        print(f"🖼 Images: {image_stats['occurrences']} occurrences, {image_stats['decoded']} decoded, "
+              f"{image_stats['written']} files written")
         return pages_data
 
     def _extract_formulas(self, text):
-        """Extract formula-like text patterns heuristically."""
-        formulas = []
-        for line in text.splitlines():
-            if any(sym in line for sym in ['=', '+', '-', '×', '÷', '∑', '∫', '√', '^', '→', '<', '>']):
-                clean = line.strip()
-                if len(clean) > 5 and not clean.lower().startswith("figure"):
-                    formulas.append(clean)
-        return formulas
+        return extract_formulas(text)
 
     # ---------------- EMBEDDING PIPELINE ----------------
     def chunk_and_embed_book(self, pdf_path, book_name, output_dir="output"):
         print(f"\n📘 Processing book: {book_name}")
         os.makedirs(output_dir, exist_ok=True)
-        pages_data = self.extract_text_images_formulas(pdf_path, output_dir)
+        pdf_hash = BookEmbeddingCache.file_hash(pdf_path)
+
+        book_key = None
+        if self.cache is not None:
+            book_key = self.cache.book_key(pdf_hash, self.chunk_size, self.chunk_overlap, self.embedding_model_name,
+                                           EXTRACTION_FORMAT)
+            all_chunks = self._load_cached_book(book_key, book_name)
+            if all_chunks is not None:
+                self.save_book_embeddings(all_chunks, os.path.join(output_dir, book_name))
+                self.cache.report()
+                return all_chunks
+
+        # Start from an empty image folder for this book; other books' folders are left for their cache hits
+        image_dir = self.book_image_dir(output_dir, pdf_hash)
+        os.makedirs(image_dir, exist_ok=True)
+        clean_directory(image_dir)
+        pages_data = self.extract_text_images_formulas(pdf_path, output_dir, image_dir)
 
         all_chunks = []
         for page_data in pages_data:
-            chunks = self.text_splitter.split_text(page_data["text"])
-            for chunk_idx, chunk in enumerate(chunks):
-                # Each chunk inherits its page’s formulas & images
-                all_chunks.append({
-                    "book_name": book_name,
-                    "page": page_data["page"],
-                    "chunk_id": f"{page_data['page']}_{chunk_idx}",
-                    "text": chunk,
-                    "formulas": page_data["formulas"],
-                    "images": page_data["images"]
-                })
+            all_chunks.extend(self._page_chunks(page_data, book_name))
 
         print(f"✅ Created {len(all_chunks)} text chunks from {len(pages_data)} pages.")
-        print("⚙ Generating embeddings...")
         texts = [chunk["text"] for chunk in all_chunks]
-        embeddings = self.embedding_model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+        embeddings = self._embed_texts(texts)
 
         for i, chunk in enumerate(all_chunks):
             chunk["embedding"] = embeddings[i]
 
         self.save_book_embeddings(all_chunks, os.path.join(output_dir, book_name))
+        if self.cache is not None:
+            self.save_book_embeddings(all_chunks, self.cache.book_path(book_key))
+            self.cache.put_book(book_key, book_name, len(all_chunks))
+            self.cache.report()
         return all_chunks
 
+    def stream_chunk_and_embed_book(self, pdf_path, book_name, output_dir="output", batch_size=256):
+        """
+        Bounded-memory variant of chunk_and_embed_book for very large books:
+        pages are split as they are extracted, chunks are embedded in batches
+        of about `batch_size`, and each batch is appended to disk by a
+        StreamingBookWriter. A run that crashes resumes after its last
+        completed batch. Writes the same `_embeddings.npy` / `_metadata.sqlite`
+        pair and returns its base path instead of the chunks.
+        """
+        print(f"\n📘 Streaming book: {book_name}")
+        os.makedirs(output_dir, exist_ok=True)
+        base_path = os.path.join(output_dir, book_name)
+        pdf_hash = BookEmbeddingCache.file_hash(pdf_path)
+        book_key = BookEmbeddingCache.book_key(pdf_hash, self.chunk_size, self.chunk_overlap,
+                                               self.embedding_model_name, EXTRACTION_FORMAT)
+
+        if self.cache is not None:
+            cached_path = self.cache.get_book(book_key)
+            if cached_path is not None and self._copy_cached_book(cached_path, base_path, book_name):
+                self.cache.report()
+                return base_path
+
+        writer = StreamingBookWriter(base_path, book_key)
+        start_page = writer.resume()
+        image_dir = self.book_image_dir(output_dir, pdf_hash)
+        os.makedirs(image_dir, exist_ok=True)
+        if start_page:
+            print(f"↻ Resuming after page {start_page} ({writer.chunks} chunks already embedded)")
+        else:
+            clean_directory(image_dir)
+
+        pending = []
+        last_page = start_page
+        for page_data in self.iter_pages(pdf_path, output_dir, start_page, image_output_dir=image_dir):
+            # Batches end on page boundaries so progress can be recorded per page
+            pending.extend(self._page_chunks(page_data, book_name))
+            last_page = page_data["page"]
+            if len(pending) >= batch_size:
+                writer.append(pending, self._embed_texts([c["text"] for c in pending], show_progress=False), last_page)
+                print(f"   … {writer.chunks} chunks embedded through page {last_page}")
+                pending = []
+        if pending or last_page != writer.pages_done:
+            embeddings = self._embed_texts([c["text"] for c in pending], show_progress=False) if pending else []
+            writer.append(pending, embeddings, last_page)
+        writer.finish()
+        print(f"💾 Saved {writer.chunks} embeddings from {last_page} pages → {base_path}")
+
+        if self.cache is not None:
+            for suffix in ("_embeddings.npy", "_metadata.sqlite"):
+                shutil.copyfile(f"{base_path}{suffix}", f"{self.cache.book_path(book_key)}{suffix}")
+            self.cache.put_book(book_key, book_name, writer.chunks)
+            self.cache.report()
+        return base_path
+
+    def iter_pages(self, pdf_path, output_dir="output", start_page=0, range_size=16, image_output_dir=None):
+        """
+        Yield extracted page dicts in page order from `start_page` on. Pages
+        are extracted in ranges of `range_size` (by extract_workers processes),
+        with at most two ranges per worker in flight.
+        """
+        if image_output_dir is None:
+            image_output_dir = os.path.join(output_dir, "book_images")
+        os.makedirs(image_output_dir, exist_ok=True)
+        with fitz.open(pdf_path) as doc:
+            num_pages = len(doc)
+        ranges = [(start, min(start + range_size, num_pages)) for start in range(start_page, num_pages, range_size)]
+
+        if self.extract_workers <= 1:
+            for start, stop in ranges:
+                yield from extract_page_range(pdf_path, image_output_dir, start, stop)[0]
+            return
+
+        with ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            in_flight = deque()
+            for start, stop in ranges:
+                in_flight.append(pool.submit(extract_page_range, pdf_path, image_output_dir, start, stop))
+                if len(in_flight) >= 2 * self.extract_workers:
+                    yield from in_flight.popleft().result()[0]
+            while in_flight:
+                yield from in_flight.popleft().result()[0]
+
+    def _page_chunks(self, page_data, book_name):
+        chunks = []
+        for chunk_idx, chunk in enumerate(self.text_splitter.split_text(page_data["text"])):
+            # Each chunk inherits its page’s formulas & images
+            chunks.append({
+                "book_name": book_name,
+                "page": page_data["page"],
+                "chunk_id": f"{page_data['page']}_{chunk_idx}",
+                "text": chunk,
+                "formulas": page_data["formulas"],
+                "images": page_data["images"]
+            })
+        return chunks
+
+    def _copy_cached_book(self, cached_path, base_path, book_name):
+        """Copy a cached book's files to base_path (renamed to book_name); False if its images are gone."""
+        metadata = load_book_metadata(cached_path)
+        num_chunks = len(metadata)
+        missing = any(not os.path.exists(path) for path in metadata.image_paths())
+        metadata.close()
+        if missing:
+            print("⚠ Cached image file(s) missing; re-extracting the book")
+            return False
+        shutil.copyfile(f"{cached_path}_embeddings.npy", f"{base_path}_embeddings.npy")
+        shutil.copyfile(f"{cached_path}_metadata.sqlite", f"{base_path}_metadata.sqlite")
+        store = BookMetadataStore(f"{base_path}_metadata.sqlite")
+        store.set_book_name(book_name)
+        store.close()
+        print(f"♻ Reusing cached embeddings for {book_name} ({num_chunks} chunks)")
+        return True
+
+    def _load_cached_book(self, book_key, book_name):
+        """Chunks of a cached book, or None on a miss or when its extracted images are gone."""
+        base_path = self.cache.get_book(book_key)
+        if base_path is None:
+            return None
+        embeddings, metadata = self.load_book_embeddings(base_path)
+        missing = [path for path in metadata.image_paths() if not os.path.exists(path)]
+        if missing:
+            print(f"⚠ {len(missing)} cached image file(s) missing; re-extracting the book")
+            metadata.close()
+            return None
+        chunks = list(metadata)
+        metadata.close()
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk["book_name"] = book_name
+            chunk["embedding"] = embedding
+        print(f"♻ Reusing cached embeddings for {book_name} ({len(chunks)} chunks)")
+        return chunks
+
+    def _embed_texts(self, texts, show_progress=True):
+        """Embed texts, only encoding those whose text hash is not in the chunk cache."""
+        if self.cache is None:
+            if show_progress:
+                print("⚙ Generating embeddings...")
+            return self.embedding_model.encode(texts, show_progress_bar=show_progress, convert_to_numpy=True)
+
+        hashes = [self.cache.text_hash(text) for text in texts]
+        cached = self.cache.get_embeddings(self.embedding_model_name, hashes)
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+
+        if show_progress:
+            print(f"⚙ Generating embeddings for {len(missing)} new chunks ({len(texts) - len(missing)} cached)...")
+        if missing:
+            new_embeddings = self.embedding_model.encode(list(missing.values()), show_progress_bar=show_progress,
+                                                         convert_to_numpy=True)
+            self.cache.put_embeddings(self.embedding_model_name, list(missing), new_embeddings)
+            cached.update(zip(missing, np.asarray(new_embeddings, dtype=np.float32)))
+        return np.stack([cached[text_hash] for text_hash in hashes]) if hashes else np.zeros((0, 0), dtype=np.float32)
+
     # ---------------- SAVE / LOAD ----------------
     def save_book_embeddings(self, chunks, base_path):
         os.makedirs(os.path.dirname(base_path), exist_ok=True)
@@ -104,14 +286,13 @@ class BookEmbeddingProcessor:
         metadata = [{k: v for k, v in c.items() if k != "embedding"} for c in chunks]
 
         np.save(f"{base_path}_embeddings.npy", embeddings)
-        with open(f"{base_path}_metadata.json", "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        write_book_metadata(base_path, metadata)
 
         print(f"💾 Saved {len(embeddings)} embeddings with linked images/formulas → {base_path}")
 
     def load_book_embeddings(self, base_path):
+        """Returns (embeddings, metadata); metadata looks chunks up lazily (see book_metadata.BookMetadata)."""
         embeddings = np.load(f"{base_path}_embeddings.npy")
-        with open(f"{base_path}_metadata.json", "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        metadata = load_book_metadata(base_path)
         print(f"📂 Loaded {len(embeddings)} embeddings from {base_path}")
         return embeddings, metadata
\ No newline at end of file
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import fitz  # PyMuPDF
+
+# Bumped whenever the extracted output changes, so cached books are re-extracted
+EXTRACTION_FORMAT = 3
+FORMULA_SYMBOLS = ['=', '+', '-', '×', '÷', '∑', '∫', '√', '^', '→', '<', '>']
+
+
+def extract_formulas(text):
+    """Extract formula-like text patterns heuristically."""
+    formulas = []
+    for line in text.splitlines():
+        if any(sym in line for sym in FORMULA_SYMBOLS):
+            clean = line.strip()
+            if len(clean) > 5 and not clean.lower().startswith("figure"):
+                formulas.append(clean)
+    return formulas
+
+
+class ImageStore:
+    """
+    Writes every distinct image of a book once. Images are deduplicated by
+    xref (the same embedded object drawn on many pages is only decoded once)
+    and by content hash (identical bytes stored under different xrefs), and
+    named after the hash so every page references the same image ID. Writes
+    are buffered and flushed in batches of about `flush_bytes`.
+    """
+
+    def __init__(self, image_output_dir, flush_bytes=32 << 20):
+        self.image_output_dir = image_output_dir
+        self.flush_bytes = flush_bytes
+        self._by_xref = {}
+        self._by_hash = {}
+        self._pending = []
+        self._pending_bytes = 0
+        self.stats = {"occurrences": 0, "decoded": 0, "written": 0}
+
+    def add(self, doc, xref):
+        """Return (image_id, file_path) for the image with this xref, queueing it for writing if new."""
+        self.stats["occurrences"] += 1
+        if xref in self._by_xref:
+            return self._by_xref[xref]
+
+        base_image = doc.extract_image(xref)
+        self.stats["decoded"] += 1
+        digest = hashlib.sha256(base_image["image"]).hexdigest()
+        if digest not in self._by_hash:
+            image_id = digest[:16]
+            img_path = os.path.join(self.image_output_dir, f"img_{image_id}.{base_image['ext']}")
+            self._by_hash[digest] = (image_id, img_path)
+            # Another extraction process (or an earlier run) may already have written the same content;
+            # files only appear under their final name once complete, so an existing one can be trusted
+            if not os.path.exists(img_path):
+                self._pending.append((img_path, base_image["image"]))
+                self._pending_bytes += len(base_image["image"])
+                if self._pending_bytes >= self.flush_bytes:
+                    self.flush()
+        self._by_xref[xref] = self._by_hash[digest]
+        return self._by_xref[xref]
+
+    def flush(self):
+        for img_path, image_bytes in self._pending:
+            # Write under a name of our own, then rename: a crash never leaves a truncated img_<hash> behind
+            tmp_path = f"{img_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, img_path)
+        self.stats["written"] += len(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+
+
+def extract_page_range(pdf_path, image_output_dir, start, stop):
+    """
+    Extract text, formulas and images of pages [start, stop) with a Document
+    of its own, so page ranges can be handled by separate processes. Returns
+    (pages_data, image_stats) with one page dict per page, in page order.
+    """
+    doc = fitz.open(pdf_path)
+    image_store = ImageStore(image_output_dir)
+    pages_data = []
+    for page_index in range(start, stop):
+        page = doc.load_page(page_index)
+        text = page.get_text("text")
+        formulas = extract_formulas(text)
+        image_paths = []
+
+        # Link each page to its (shared) images; an image drawn twice on a page is listed once
+        seen = set()
+        for img in page.get_images(full=True):
+            image_id, img_path = image_store.add(doc, img[0])
+            if image_id in seen:
+                continue
+            seen.add(image_id)
+            image_paths.append({
+                "file_path": img_path,
+                "page": page_index + 1,
+                "image_id": image_id
+            })
+
+        pages_data.append({
+            "page": page_index + 1,
+            "text": text,
+            "formulas": [{"formula": f, "page": page_index + 1} for f in formulas],
+            "images": image_paths
+        })
+    image_store.flush()
+    doc.close()
+    return pages_data, image_store.stats
@@ -3,35 +3,70 @@ import soundfile as sf
 from pathlib import Path
 import noisereduce as nr
 from scipy import signal
-from transformers import pipeline
 import torch
 import torchaudio.transforms as T
 import subprocess
 import tempfile
 import os
-from sentence_transformers import SentenceTransformer
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import registry
 import warnings
 
 warnings.filterwarnings("ignore")
 
+FFMPEG_PATH = 'C:/ffmpeg-master-latest-win64-gpl-shared/bin/ffmpeg.exe' # make the path change here
+
+def _reduce_noise_block(block, sr):
+    return nr.reduce_noise(y=block, sr=sr, stationary=True).astype(np.float32)
+
+def _iter_overlapping_blocks(chunks, block_samples, overlap_samples):
+    """Re-block a chunk stream into (block, context_length) pairs with left-context overlap."""
+    buffer = np.zeros(0, dtype=np.float32)
+    context = np.zeros(0, dtype=np.float32)
+    for chunk in chunks:
+        buffer = np.concatenate((buffer, np.asarray(chunk, dtype=np.float32)))
+        while len(buffer) >= block_samples:
+            block = buffer[:block_samples]
+            yield np.concatenate((context, block)), len(context)
+            context = block[len(block) - overlap_samples:]
+            buffer = buffer[block_samples:]
+    if len(buffer) > 0:
+        yield np.concatenate((context, buffer)), len(context)
+
 class AudioVectorizer:
+    SAMPLE_RATE = 16000
+
     def __init__(self, hf_asr_model="openai/whisper-base"): 
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device}")
 
-        print(f"Loading HF ASR model ({hf_asr_model})...")
-        self.transcription_model = pipeline(
-                "automatic-speech-recognition",
-                model=hf_asr_model,
-                device=self.device
-            )
-        print("HF ASR (Whisper) model loaded successfully.")
-
-        print("Loading text embedding model (all-MiniLM-L6-v2)...")
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
-        print("Text embedding model loaded successfully.")
+        self._model_keys = [
+            ("asr", hf_asr_model, self.device),
+        ]
+        self.transcription_model = registry.acquire(*self._model_keys[0])
+        self._embedding_model = None
         print("Models loaded successfully.")
 
+        self._silence_embedding = None
+        self.vad_report = {}
+
+    def close(self):
+        """Release this vectorizer's references in the shared model registry."""
+        for key in self._model_keys:
+            registry.release(*key)
+        self._model_keys = []
+        self._embedding_model = None
+
+    @property
+    def embedding_model(self):
+        """MiniLM, acquired on first use only: the pipeline itself embeds in the deferred embedding stage."""
+        if self._embedding_model is None:
+            self._model_keys.append(("sentence-transformer", "all-MiniLM-L6-v2", self.device))
+            self._embedding_model = registry.acquire(*self._model_keys[-1])
+        return self._embedding_model
+
     def load_audio(self, audio_path):
         file_ext = Path(audio_path).suffix.lower()
         
@@ -42,7 +77,7 @@ class AudioVectorizer:
                     tmp_path = tmp_file.name
                 
                 command = [
-                    'C:/ffmpeg-master-latest-win64-gpl-shared/bin/ffmpeg.exe', # make the path change here
+                    FFMPEG_PATH,
                     '-i', str(audio_path),
                     '-vn',
                     '-acodec', 'pcm_s16le',
@@ -81,8 +116,154 @@ class AudioVectorizer:
             sr = 16000
             
         return audio, sr
-    
+
+    def stream_audio(self, audio_path, chunk_seconds=30):
+        """
+        Generator that decodes the lecture as 16 kHz mono float32 chunks of at
+        most `chunk_seconds`, reading ffmpeg's stdout directly instead of
+        round-tripping a temp WAV through the disk. Only one chunk is held in
+        memory at a time.
+        """
+        sr = self.SAMPLE_RATE
+        chunk_samples = int(chunk_seconds * sr)
+        file_ext = Path(audio_path).suffix.lower()
+
+        if file_ext in ['.wav', '.flac'] and sf.info(str(audio_path)).samplerate == sr:
+            for block in sf.blocks(str(audio_path), blocksize=chunk_samples, dtype='float32'):
+                if len(block.shape) > 1:
+                    block = np.mean(block, axis=1)
+                yield block
+            return
+
+        command = [
+            FFMPEG_PATH,
+            '-loglevel', 'error',
+            '-i', str(audio_path),
+            '-vn',
+            '-f', 'f32le',
+            '-acodec', 'pcm_f32le',
+            '-ar', str(sr),
+            '-ac', '1',
+            'pipe:1'
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        chunk_bytes = chunk_samples * 4
+        try:
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                usable = len(data) - len(data) % 4
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=np.float32)
+        except GeneratorExit:
+            # Closed early by the consumer: ffmpeg is still decoding, so stop it
+            process.kill()
+            raise
+        finally:
+            # At EOF ffmpeg may still be shutting down; wait for it instead of killing it
+            process.stdout.close()
+            stderr = process.stderr.read().decode('utf-8', errors='ignore')
+            process.stderr.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            print(f"FFmpeg failed to decode {audio_path}.")
+            print("FFmpeg stderr:", stderr)
+            raise IOError("FFmpeg decoding failed.")
+
+    def clean_audio_stream(self, chunks, sr, block_seconds=30, overlap_seconds=0.5,
+                           normalize="two_pass", workers=1):
+        """
+        Block-wise, bounded-memory version of clean_audio.
+
+        The stream is re-blocked into `block_seconds` blocks that each carry
+        `overlap_seconds` of left context. Spectral gating runs per block
+        (optionally on a process pool of `workers`) and neighbouring blocks
+        are crossfaded over the overlap (overlap-add). The high-pass filter
+        state is carried across blocks.
+
+        normalize="two_pass" spools the filtered audio to a temp file,
+        then replays it scaled by the global peak like clean_audio.
+        normalize="running" scales each block by the peak seen so far and
+        needs no spool, but early blocks are divided by a smaller peak than
+        later ones: loudness drifts across the lecture and a quiet passage
+        can land on a different side of the VAD's dBFS threshold than it
+        would with the global peak.
+        """
+        block_samples = int(block_seconds * sr)
+        overlap_samples = min(int(overlap_seconds * sr), block_samples)
+        blocks = _iter_overlapping_blocks(chunks, block_samples, overlap_samples)
+        denoised = self._overlap_add(self._reduce_noise_blocks(blocks, sr, workers), overlap_samples)
+        filtered = self._highpass_stream(denoised, sr)
+
+        if normalize == "two_pass":
+            yield from self._normalize_two_pass(filtered, block_samples)
+        else:
+            peak = 1e-8
+            for block in filtered:
+                peak = max(peak, float(np.abs(block).max(initial=0.0)))
+                yield (block / peak).astype(np.float32)
+
+    def _reduce_noise_blocks(self, blocks, sr, workers):
+        """Yield (denoised_block, context_length) in order, using a bounded process pool if workers > 1."""
+        if workers <= 1:
+            for block, context in blocks:
+                yield _reduce_noise_block(block, sr), context
+            return
+
+        # spawn, not fork: this runs next to other stage threads and torch/OpenMP pools, which a fork can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = deque()
+            for block, context in blocks:
+                pending.append((executor.submit(_reduce_noise_block, block, sr), context))
+                if len(pending) >= 2 * workers:
+                    future, ctx = pending.popleft()
+                    yield future.result(), ctx
+            while pending:
+                future, ctx = pending.popleft()
+                yield future.result(), ctx
+
+    def _overlap_add(self, blocks, overlap_samples):
+        """Crossfade each block's context region into the held-back tail of the previous block."""
+        held = None
+        for block, context in blocks:
+            if held is not None and context:
+                fade = np.linspace(0.0, 1.0, context, dtype=np.float32)
+                block = np.concatenate((held * (1.0 - fade) + block[:context] * fade, block[context:]))
+            elif held is not None:
+                yield held
+            if overlap_samples and len(block) > overlap_samples:
+                yield block[:-overlap_samples]
+                held = block[-overlap_samples:]
+            else:
+                held = block
+        if held is not None:
+            yield held
+
+    def _highpass_stream(self, blocks, sr):
+        sos = signal.butter(5, 80, 'hp', fs=sr, output='sos')
+        zi = np.zeros((sos.shape[0], 2))
+        for block in blocks:
+            block, zi = signal.sosfilt(sos, block, zi=zi)
+            yield block.astype(np.float32)
+
+    def _normalize_two_pass(self, blocks, block_samples):
+        peak = 0.0
+        with tempfile.TemporaryFile() as spool:
+            for block in blocks:
+                peak = max(peak, float(np.abs(block).max(initial=0.0)))
+                spool.write(block.tobytes())
+            spool.seek(0)
+            scale = 1.0 / peak if peak > 1e-8 else 1.0
+            while True:
+                data = spool.read(block_samples * 4)
+                if not data:
+                    break
+                yield np.frombuffer(data, dtype=np.float32) * np.float32(scale)
+
     def clean_audio(self, audio, sr):
+        """Whole-waveform cleaning; the pipeline uses the bounded-memory clean_audio_stream instead."""
         audio = nr.reduce_noise(y=audio, sr=sr, stationary=True)
         sos = signal.butter(5, 80, 'hp', fs=sr, output='sos')
         audio = signal.sosfilt(sos, audio)
@@ -92,21 +273,61 @@ class AudioVectorizer:
         
         return audio
     
-    def split_audio(self, audio, sr, segment_length=10):
+    def split_audio(self, audio, sr, segment_length=10, hop_length=None):
+        """
+        Split audio into a single (n_segments, segment_samples) array.
+
+        When the audio is an exact multiple of the segment length this is a
+        reshaped view of the input; otherwise the audio is copied once into
+        a buffer with one zero-padded tail. A `hop_length` (seconds) shorter
+        than `segment_length` yields overlapping windows as a read-only
+        strided view over that buffer.
+        """
+        audio = np.asarray(audio)
         segment_samples = int(segment_length * sr)
-        segments = []
-        
-        for start in range(0, len(audio), segment_samples):
-            end = min(start + segment_samples, len(audio))
-            segment = audio[start:end]
-            
-            if len(segment) < segment_samples and len(segment) > 0:
-                segment = np.pad(segment, (0, segment_samples - len(segment)))
-            
-            if len(segment) == segment_samples:
-                segments.append(segment)
-                
-        return segments
+        hop_samples = int(hop_length * sr) if hop_length else segment_samples
+
+        if len(audio) == 0:
+            return np.zeros((0, segment_samples), dtype=audio.dtype)
+
+        num_segments = -(-max(len(audio) - segment_samples, 0) // hop_samples) + 1
+        padded_length = (num_segments - 1) * hop_samples + segment_samples
+        if padded_length == len(audio):
+            buffer = np.ascontiguousarray(audio)
+        else:
+            buffer = np.zeros(padded_length, dtype=audio.dtype)
+            buffer[:len(audio)] = audio
+
+        if hop_samples == segment_samples:
+            return buffer.reshape(num_segments, segment_samples)
+
+        stride = buffer.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            buffer,
+            shape=(num_segments, segment_samples),
+            strides=(hop_samples * stride, stride),
+            writeable=False
+        )
+
+    def split_audio_stream(self, chunks, sr, segment_length=10, block_segments=1):
+        """
+        Streaming counterpart of split_audio: re-blocks streamed chunks and
+        yields (k, segment_samples) arrays of up to `block_segments` segments,
+        each built by split_audio, so batch consumers (VAD, Whisper) get a
+        ready 2-D array. Only the last block is shorter and zero-padded.
+        """
+        block_samples = int(segment_length * sr) * block_segments
+        buffer = np.zeros(0, dtype=np.float32)
+
+        for chunk in chunks:
+            buffer = np.concatenate((buffer, chunk))
+            while len(buffer) >= block_samples:
+                # An exact multiple of the segment length, so this is a reshaped view
+                yield self.split_audio(buffer[:block_samples], sr, segment_length)
+                buffer = buffer[block_samples:]
+
+        if len(buffer) > 0:
+            yield self.split_audio(buffer, sr, segment_length)
     
     def resample_audio(self, audio_tensor, orig_sr, target_sr):
         audio_tensor = audio_tensor.to(self.device)
@@ -115,6 +336,184 @@ class AudioVectorizer:
         resampled = resampler(audio_tensor)
         return resampled
     
+    def detect_voiced_segments(self, audio_segments, sample_rate, frame_ms=30,
+                               energy_threshold_db=-40.0, min_voiced_ratio=0.1, report=True):
+        """
+        Lightweight energy-based VAD pre-pass over a split_audio
+        (n_segments, segment_samples) array.
+
+        A segment counts as voiced when at least `min_voiced_ratio` of its
+        `frame_ms` frames are louder than `energy_threshold_db` (dBFS of the
+        peak-normalized audio from clean_audio). Returns a boolean mask and,
+        unless report=False, stores a compute-skipped report in self.vad_report.
+        """
+        frame_samples = max(1, int(sample_rate * frame_ms / 1000))
+        voiced_mask = np.zeros(len(audio_segments), dtype=bool)
+
+        # One vectorized pass over the (n_segments, segment_samples) array
+        segments = np.asarray(audio_segments, dtype=np.float32)
+        num_frames = segments.shape[1] // frame_samples if segments.ndim == 2 else 0
+        if num_frames:
+            frames = segments[:, :num_frames * frame_samples].reshape(len(segments), num_frames, frame_samples)
+            rms = np.sqrt(np.mean(frames ** 2, axis=2))
+            frame_db = 20 * np.log10(rms + 1e-10)
+            voiced_mask = np.mean(frame_db > energy_threshold_db, axis=1) >= min_voiced_ratio
+
+        if report:
+            segment_seconds = len(audio_segments[0]) / sample_rate if len(audio_segments) else 0.0
+            self.report_vad(voiced_mask, segment_seconds)
+        return voiced_mask
+
+    def report_vad(self, voiced_mask, segment_seconds):
+        """Store and print how much ASR + embedding work the VAD mask skips (both modes skip silent segments)."""
+        num_segments = len(voiced_mask)
+        num_silent = int(num_segments - np.count_nonzero(voiced_mask))
+        self.vad_report = {
+            "segments": num_segments,
+            "silent_segments": num_silent,
+            "skipped_ratio": num_silent / num_segments if num_segments else 0.0,
+            "skipped_audio_seconds": num_silent * segment_seconds,
+        }
+        print(f"       VAD: {num_silent}/{num_segments} segments silent "
+              f"({self.vad_report['skipped_ratio']:.1%} of ASR + embedding work skipped)")
+        return self.vad_report
+
+    def get_silence_embedding(self):
+        """Cached all-zero embedding used for segments the VAD marks as silent."""
+        if self._silence_embedding is None:
+            dim = self.embedding_model.get_sentence_embedding_dimension()
+            self._silence_embedding = np.zeros(dim, dtype=np.float32)
+        return self._silence_embedding
+
+    def transcribe_batch(self, audio_segments, sample_rate, batch_size=8, voiced_mask=None):
+        """
+        Transcribe every row of a split_audio (n_segments, segment_samples)
+        array with Whisper, running the ASR pipeline on micro-batches of
+        `batch_size` segments at a time.
+        Segments marked False in `voiced_mask` are skipped and left empty.
+
+        Returns a list of transcripts aligned with the segment indices.
+        """
+        transcripts = [""] * len(audio_segments)
+        if voiced_mask is None:
+            indices = list(range(len(audio_segments)))
+        else:
+            indices = [i for i in range(len(audio_segments)) if voiced_mask[i]]
+        num_batches = (len(indices) + batch_size - 1) // batch_size
+        print(f"       Transcribing {len(indices)} segments with Whisper "
+              f"({num_batches} batches of up to {batch_size})...")
+
+        for start in range(0, len(indices), batch_size):
+            batch_indices = indices[start:start + batch_size]
+            batch = [
+                {"raw": np.asarray(audio_segments[i], dtype=np.float32), "sampling_rate": sample_rate}
+                for i in batch_indices
+            ]
+            results = self.transcription_model(
+                batch,
+                batch_size=len(batch),
+                generate_kwargs={"task": "transcribe"}
+            )
+            for i, result in zip(batch_indices, results):
+                transcripts[i] = result["text"].strip().upper()
+
+        return transcripts
+
+    def transcribe_long_form_stream(self, segment_batches, sample_rate, segment_length=10, window_segments=30,
+                                    context_segments=1, chunk_length_s=30, stride_length_s=5, batch_size=8,
+                                    timestamps="word"):
+        """
+        Long-form transcription over a stream of split_audio segments: Whisper
+        runs with overlapping chunk strides and timestamps, and the timestamped
+        words are bucketed into the fixed `segment_length` slots. `segment_batches`
+        yields (segments, voiced_mask) micro-batches; segments are gathered into
+        windows of `window_segments` and each window is transcribed on its own, so at
+        most one window (plus its context) of audio is held at a time.
+        Segments marked False in the voiced mask end the current window and
+        are never sent to Whisper; their transcripts are left empty, as in
+        transcribe_batch.
+
+        Each window is transcribed with `context_segments` of audio on both
+        sides: the end of the previous window on the left and the start of
+        the next one on the right. A window only keeps the words whose
+        timestamp midpoint falls inside it, so a word crossing a window
+        boundary is heard whole and counted exactly once, and words cut off
+        at the edges of the transcribed audio (inside the context) are
+        dropped. Yields (transcripts, voiced_mask) per window or silent
+        segment, aligned with the segment indices.
+        """
+        def flush(own, right):
+            return self._transcribe_window(context, own, right, sample_rate, segment_length, chunk_length_s,
+                                           stride_length_s, batch_size, timestamps)
+
+        pending, voiced, context = [], [], []
+        for segments, batch_voiced in segment_batches:
+            for i, segment in enumerate(segments):
+                if batch_voiced is not None and not batch_voiced[i]:
+                    if pending:
+                        yield flush(pending, []), voiced
+                    # Nothing is cut off at a silent boundary, so neither side needs context
+                    pending, voiced, context = [], [], []
+                    yield [""], [False]
+                    continue
+                pending.append(np.asarray(segment, dtype=np.float32))
+                voiced.append(None if batch_voiced is None else True)
+                # Wait for the next window's first segments, which serve as this window's right context
+                if len(pending) == window_segments + context_segments:
+                    own, right = pending[:window_segments], pending[window_segments:]
+                    yield flush(own, right), voiced[:window_segments]
+                    context = own[len(own) - context_segments:] if context_segments else []
+                    pending, voiced = right, voiced[window_segments:]
+        if pending:
+            yield flush(pending, []), voiced
+
+    def _transcribe_window(self, context, window, right, sample_rate, segment_length, chunk_length_s,
+                           stride_length_s, batch_size, timestamps):
+        audio = np.concatenate(context + window + right)
+        result = self.transcription_model(
+            {"raw": audio, "sampling_rate": sample_rate},
+            chunk_length_s=chunk_length_s,
+            stride_length_s=stride_length_s,
+            batch_size=batch_size,
+            return_timestamps=timestamps,
+            generate_kwargs={"task": "transcribe"}
+        )
+        window_start = len(context) * segment_length
+        window_end = window_start + len(window) * segment_length
+        chunks = []
+        for chunk in result.get("chunks", []):
+            start, end = chunk["timestamp"]
+            start = end if start is None else start
+            end = start if end is None else end
+            if start is None or not window_start <= (start + end) / 2 < window_end:
+                continue
+            chunks.append({"text": chunk["text"], "timestamp": (start - window_start, end - window_start)})
+        return self.bucket_timestamped_chunks(chunks, len(window), segment_length)
+
+    def bucket_timestamped_chunks(self, chunks, num_slots, segment_length=10):
+        """Assign each timestamped chunk to the slot containing its midpoint."""
+        if num_slots == 0:
+            return []
+        slots = [[] for _ in range(num_slots)]
+
+        for chunk in chunks:
+            text = chunk["text"].strip()
+            if not text:
+                continue
+            start, end = chunk["timestamp"]
+            if start is None:
+                start = end if end is not None else 0.0
+            if end is None:
+                end = start
+            slot = int(((start + end) / 2) // segment_length)
+            slots[min(max(slot, 0), num_slots - 1)].append(text)
+
+        return [" ".join(words).upper() for words in slots]
+
+    def get_text_embedding(self, text):
+        embedding = self.embedding_model.encode(text)
+        return embedding
+
     def get_transcript_embedding(self, audio_segment, sample_rate):
         text = ""    
         print("       Transcribing segment with Whisper...")
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class DeferredEmbeddingStage:
+    """
+    Collects every segment's transcript and video text during run_pipeline and
+    encodes them in large batches once all segments are known, writing the
+    vectors straight into one preallocated fused array laid out as
+    [audio | video | audio * video].
+    """
+
+    def __init__(self, embedding_model, audio_dim=384, video_dim=384, batch_size=64):
+        if audio_dim != video_dim:
+            raise ValueError("Audio and video embeddings must share a dimension to be fused.")
+        self.embedding_model = embedding_model
+        self.audio_dim = audio_dim
+        self.video_dim = video_dim
+        self.batch_size = batch_size
+
+        self.transcripts = []
+        self.video_texts = []
+        self.silent = []
+        self.fused = None
+
+    def add_segment(self, transcript, video_text, silent=False):
+        self.transcripts.append(transcript)
+        self.video_texts.append(video_text)
+        self.silent.append(bool(silent))
+
+    def __len__(self):
+        return len(self.transcripts)
+
+    @property
+    def audio_embeddings(self):
+        return self.fused[:, :self.audio_dim]
+
+    @property
+    def video_embeddings(self):
+        return self.fused[:, self.audio_dim:self.audio_dim + self.video_dim]
+
+    def run(self):
+        """Encode all collected texts and fill the fused array. Returns the fused array."""
+        num_segments = len(self.transcripts)
+        self.fused = np.zeros((num_segments, self.audio_dim + 2 * self.video_dim), dtype=np.float32)
+
+        # Silent segments keep a zero audio vector; empty video text keeps a zero video vector
+        audio_indices = [i for i in range(num_segments) if not self.silent[i]]
+        video_indices = [i for i in range(num_segments) if self.video_texts[i]]
+
+        print(f"⚙ Encoding {len(audio_indices)} transcripts and {len(video_indices)} video texts "
+              f"in batches of {self.batch_size}...")
+        self._encode_into(self.transcripts, audio_indices, self.audio_embeddings)
+        self._encode_into(self.video_texts, video_indices, self.video_embeddings)
+        np.multiply(self.audio_embeddings, self.video_embeddings, out=self.fused[:, self.audio_dim + self.video_dim:])
+        return self.fused
+
+    def _encode_into(self, texts, indices, out):
+        for start in range(0, len(indices), self.batch_size):
+            batch_indices = indices[start:start + self.batch_size]
+            out[batch_indices] = self.embedding_model.encode(
+                [texts[i] for i in batch_indices],
+                batch_size=self.batch_size,
+                convert_to_numpy=True
+            )
+
+    def save(self, fused_path, audio_path, video_path):
+        np.save(fused_path, self.fused)
+        np.save(audio_path, self.audio_embeddings)
+        np.save(video_path, self.video_embeddings)
+        print(f"💾 Saved {len(self.fused)} fused/audio/video embeddings")
@@ -1,27 +1,199 @@
 import cv2
 import torch
-from transformers import AutoProcessor, AutoModelForVision2Seq, BlipProcessor, BlipForConditionalGeneration, TrOCRProcessor, VisionEncoderDecoderModel
-from sentence_transformers import SentenceTransformer
 from PIL import Image
 import numpy as np
 import re
 from pathlib import Path
-import easyocr 
+from collections import OrderedDict
+from model_registry import registry
+from ocr_detection import ParallelTextDetector
 
 # Suppress a specific transformers warning
 from transformers.utils import logging
 logging.set_verbosity_error()
 
+CAPTION_MODELS = {
+    "large": "Salesforce/blip-image-captioning-large",
+    "base": "Salesforce/blip-image-captioning-base",
+}
+
+def dhash(image, hash_size=8):
+    """Difference hash of an image as an int of hash_size**2 bits (cache key for near-identical images)."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class SlideChangeDetector:
+    """
+    Detects frames where the slide or board has not changed, so their OCR and
+    caption results can be reused.
+
+    Frames are compared as downsampled grayscale thumbnails: a frame is the
+    same slide only if at most `min_changed` of the thumbnail pixels moved by
+    more than `pixel_threshold` grey levels. One new line of a slide build or
+    a few pen strokes change far more pixels than that, while re-encoding
+    noise and slight exposure drift change none; a coarse perceptual hash
+    flips only a handful of bits for a new line and would merge the builds.
+    """
+
+    def __init__(self, width=320, pixel_threshold=32, min_changed=0.0002):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+
+    def thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height = max(1, round(gray.shape[0] * self.width / gray.shape[1]))
+        return cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA)
+
+    def is_same_slide(self, thumb_a, thumb_b):
+        if thumb_a.shape != thumb_b.shape:
+            return False
+        changed = np.count_nonzero(cv2.absdiff(thumb_a, thumb_b) > self.pixel_threshold)
+        return changed <= self.min_changed * thumb_a.size
+
+class ContentRegionFinder:
+    """
+    Finds the stable content region (slide or board) of a lecture layout,
+    e.g. the slide next to a webcam inset, from the first frames of a video.
+
+    Per cell of a coarse grid it tracks how often the cell changed between
+    consecutive samples (a webcam feed changes every time, a slide only on
+    slide transitions) and whether it ever held edges or non-black pixels
+    (letterbox bars never do). The region is the bounding box of the static,
+    non-blank cells, so it trims a webcam strip and black bars but never an
+    empty part of the slide itself; None means "use the whole frame".
+    """
+
+    def __init__(self, sample_frames=10, cell=16, edge_threshold=0.02, black_level=16, motion_threshold=0.6,
+                 min_area=0.2, padding=32):
+        self.sample_frames = sample_frames
+        self.cell = cell
+        self.edge_threshold = edge_threshold
+        self.black_level = black_level
+        self.motion_threshold = motion_threshold
+        self.min_area = min_area
+        self.padding = padding
+        self.reset()
+
+    def reset(self):
+        self.shape = None
+        self.count = 0
+        self._edge_max = None
+        self._gray_max = None
+        self._change_sum = None
+        self._previous = None
+
+    @property
+    def done(self):
+        return self.count >= self.sample_frames
+
+    def add(self, frame):
+        if self.done or (self.shape is not None and frame.shape[:2] != self.shape):
+            return
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height, width = gray.shape
+        grid = (max(1, width // self.cell), max(1, height // self.cell))
+        edges = cv2.resize((cv2.Canny(gray, 100, 200) > 0).astype(np.float32), grid, interpolation=cv2.INTER_AREA)
+        brightness = cv2.resize(gray, grid, interpolation=cv2.INTER_AREA)
+        if self.shape is None:
+            self.shape = (height, width)
+            self._edge_max = np.zeros_like(edges)
+            self._gray_max = np.zeros_like(brightness)
+            self._change_sum = np.zeros_like(edges)
+        else:
+            # A cell "changed" when over 10% of its pixels moved by more than 25 grey levels
+            moved = (cv2.absdiff(gray, self._previous) > 25).astype(np.float32)
+            self._change_sum += cv2.resize(moved, grid, interpolation=cv2.INTER_AREA) > 0.1
+        np.maximum(self._edge_max, edges, out=self._edge_max)
+        np.maximum(self._gray_max, brightness, out=self._gray_max)
+        self._previous = gray
+        self.count += 1
+        if self.done:
+            self._previous = None
+
+    def find(self):
+        """Return (x0, y0, x1, y1) of the content region in frame pixels, or None."""
+        if self.count == 0:
+            return None
+        motion = self._change_sum / max(1, self.count - 1)  # fraction of sample pairs in which the cell changed
+        # Grow the moving area by a cell so the edges along a webcam inset's border don't count as content
+        moving = cv2.dilate((motion >= self.motion_threshold).astype(np.uint8), np.ones((3, 3), np.uint8))
+        blank = (self._edge_max <= self.edge_threshold) & (self._gray_max < self.black_level)
+        ys, xs = np.nonzero(~blank & (moving == 0))
+        if len(xs) == 0:
+            return None
+
+        height, width = self.shape
+        cell_w, cell_h = width / motion.shape[1], height / motion.shape[0]
+        x0 = max(0, int(xs.min() * cell_w) - self.padding)
+        y0 = max(0, int(ys.min() * cell_h) - self.padding)
+        x1 = min(width, int((xs.max() + 1) * cell_w) + self.padding)
+        y1 = min(height, int((ys.max() + 1) * cell_h) + self.padding)
+        if (x1 - x0) * (y1 - y0) < self.min_area * width * height:
+            return None  # too small to be the slide; don't risk cutting text off
+        return (x0, y0, x1, y1)
+
+
+def detect_text_boxes(frames, detect_fn, region=None, scale=1.0):
+    """
+    Run easyocr-style detection on each frame's content `region`, downscaled
+    by `scale`, and map the boxes back to full-frame coordinates so crops can
+    be cut at full resolution. detect_fn(images) returns readtext(detail=1)
+    results per image.
+    """
+    offsets = []
+    images = []
+    for frame in frames:
+        x0, y0 = 0, 0
+        if region is not None and frame.shape[0] >= region[3] and frame.shape[1] >= region[2]:
+            x0, y0, x1, y1 = region
+            frame = frame[y0:y1, x0:x1]
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        offsets.append((x0, y0))
+        images.append(frame)
+
+    return [
+        [([(x / scale + x0, y / scale + y0) for x, y in bbox], text, confidence)
+         for bbox, text, confidence in detections]
+        for (x0, y0), detections in zip(offsets, detect_fn(images))
+    ]
+
+
 class VideoTextExtractor:
     
-    def __init__(self):
-        import torch
-        from transformers import VisionEncoderDecoderModel, TrOCRProcessor, BlipProcessor, BlipForConditionalGeneration
-        from sentence_transformers import SentenceTransformer
-        import easyocr
-
+    def __init__(self, dedup_min_changed=0.0002, htr_batch_size=16, ocr_mode="trocr", easyocr_min_confidence=0.6,
+                 caption_model="large", caption_batch_size=8, caption_cache_size=512, detector_workers=1,
+                 region_cache_size=4096, detection_scale=1.0, roi_frames=0, detector_threads=None):
+        """
+        dedup_min_changed: fraction of a frame's downsampled pixels that must
+        change for it to count as a new slide, see SlideChangeDetector (None
+        disables dedup; `pipeline.py check-dedup` checks builds survive it).
+        htr_batch_size: number of text crops per batched TrOCR generate call.
+        ocr_mode: "trocr" re-recognizes every crop with TrOCR; "cascade" accepts
+        easyocr's own text when its confidence is at least
+        easyocr_min_confidence and only sends the rest to TrOCR.
+        caption_model: BLIP tier from CAPTION_MODELS ("large", or the cheaper
+        "base") or a Hugging Face model id.
+        caption_batch_size / caption_cache_size: frames per BLIP generate call
+        and number of perceptual-hash buckets kept in the caption LRU cache.
+        region_cache_size: text regions whose TrOCR result is kept in the
+        crop-hash LRU cache, so unchanged parts of a board are not re-read.
+        detection_scale: downscale factor for the image text detection runs on;
+        boxes are scaled back up and crops cut from the full-resolution frame.
+        roi_frames: frames sampled at the start of each lecture to find the
+        slide/board region detection is restricted to (0, the default, disables;
+        check recall with `pipeline.py bench-detection` before enabling).
+        detector_workers: processes running easyocr detection in parallel
+        (1 keeps it in this process). Only used on CPU.
+        detector_threads: torch threads shared by those processes; defaults to
+        half of this process's torch.get_num_threads(), leaving the rest for
+        TrOCR and BLIP (and, in a branch process, staying inside its budget).
+        """
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        use_gpu = torch.cuda.is_available()
         
         if self.device == "cpu":
             print("="*50)
@@ -30,73 +202,336 @@ class VideoTextExtractor:
         else:
             print(f"Using device: {self.device}")
 
-        print("Loading Text Detector (easyocr)...")
-        self.text_detector = easyocr.Reader(['en'], gpu=use_gpu)
-
-        print("Loading HTR model (microsoft/trocr-large-handwritten)...")
-        # Force safetensors to avoid PyTorch 2.6 requirement
-        self.htr_processor = TrOCRProcessor.from_pretrained(
-            "microsoft/trocr-large-handwritten",
-            use_safetensors=True
-        )
-        self.htr_model = VisionEncoderDecoderModel.from_pretrained(
-            "microsoft/trocr-large-handwritten",
-            use_safetensors=True
-        ).to(self.device)
-
-        print("Loading Image Captioning model (Salesforce/blip-image-captioning-large)...")
-        # BLIP models also support safetensors
-        self.caption_processor = BlipProcessor.from_pretrained(
-            "Salesforce/blip-image-captioning-large",
-            use_safetensors=True
-        )
-        self.caption_model = BlipForConditionalGeneration.from_pretrained(
-            "Salesforce/blip-image-captioning-large",
-            use_safetensors=True
-        ).to(self.device)
-
-        print("Loading NLP embedding model (all-MiniLM-L6-v2)...")
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
+        self._model_keys = [
+            ("trocr", "microsoft/trocr-large-handwritten", self.device),
+            ("blip", CAPTION_MODELS.get(caption_model, caption_model), self.device),
+        ]
+        self.htr_processor, self.htr_model = registry.acquire(*self._model_keys[0])
+        self.caption_processor, self.caption_model = registry.acquire(*self._model_keys[1])
+        self._embedding_model = None
+
+        # On the GPU one detector is already fast; on CPU, shard detection across processes
+        self.parallel_detector = None
+        self.text_detector = None
+        if detector_workers > 1 and self.device == "cpu":
+            if detector_threads is None:
+                detector_threads = max(1, torch.get_num_threads() // 2)
+            self.parallel_detector = ParallelTextDetector(detector_workers, lang="en", device=self.device,
+                                                          thread_budget=detector_threads)
+            print(f"Running text detection in {self.parallel_detector.workers} worker processes "
+                  f"({detector_threads} torch threads between them)")
+        else:
+            self._model_keys.append(("easyocr", "en", self.device))
+            self.text_detector = registry.acquire(*self._model_keys[-1])
+
+        self.htr_batch_size = htr_batch_size
+        self.ocr_mode = ocr_mode
+        self.easyocr_min_confidence = easyocr_min_confidence
+        self.caption_batch_size = caption_batch_size
+        self.caption_cache_size = caption_cache_size
+        self._caption_cache = OrderedDict()
+        self.caption_matcher = SlideChangeDetector()
+        self.region_cache_size = region_cache_size
+        self._region_cache = OrderedDict()
+        self.slide_detector = SlideChangeDetector(min_changed=dedup_min_changed) if dedup_min_changed is not None else None
+        self.detection_scale = detection_scale
+        self.region_finder = ContentRegionFinder(sample_frames=roi_frames) if roi_frames else None
+        self.reset_lecture_state()
+
+    def close(self):
+        """Release this extractor's references in the shared model registry."""
+        for key in self._model_keys:
+            registry.release(*key)
+        self._model_keys = []
+        self._embedding_model = None
+        if self.parallel_detector is not None:
+            self.parallel_detector.close()
+            self.parallel_detector = None
+
+    @property
+    def embedding_model(self):
+        """MiniLM, acquired on first use only: the pipeline itself embeds in the deferred embedding stage."""
+        if self._embedding_model is None:
+            self._model_keys.append(("sentence-transformer", "all-MiniLM-L6-v2", self.device))
+            self._embedding_model = registry.acquire(*self._model_keys[-1])
+        return self._embedding_model
+
+    def reset_lecture_state(self):
+        """Clear per-lecture caches and counters (call before each new lecture)."""
+        self._last_thumbnail = None
+        self._last_frame_results = None
+        self.dedup_stats = {"frames": 0, "reused": 0}
+        self.ocr_stats = {"easyocr": 0, "trocr": 0}
+        self.caption_stats = {"cached": 0, "generated": 0}
+        self.region_stats = {"hits": 0, "misses": 0}
+        self.content_region = None
+        if self.region_finder is not None:
+            self.region_finder.reset()
+
+    def report_stats(self):
+        frames = self.dedup_stats["frames"]
+        ratio = self.dedup_stats["reused"] / frames if frames else 0.0
+        print(f"Slide dedup: reused OCR/captions for {self.dedup_stats['reused']}/{frames} frames ({ratio:.1%})")
+        print(f"OCR paths: {self.ocr_stats['easyocr']} crops accepted from easyocr, "
+              f"{self.ocr_stats['trocr']} sent to TrOCR")
+        print(f"Captions: {self.caption_stats['generated']} generated, {self.caption_stats['cached']} from cache")
+        regions = self.region_stats["hits"] + self.region_stats["misses"]
+        hit_rate = self.region_stats["hits"] / regions if regions else 0.0
+        print(f"Text regions: {self.region_stats['hits']}/{regions} TrOCR results reused from cache ({hit_rate:.1%})")
 
     def extract_info_from_batch(self, frame_batch):
-        unique_text_fragments = set()
-        unique_image_captions = set()
-        
-        for frame in frame_batch:
-            detections = self.text_detector.readtext(frame, detail=1, paragraph=False)
-            pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            for (bbox, _, _) in detections:
+        return self.extract_info_from_batches([frame_batch])[0]
+
+    def extract_info_from_batches(self, frame_batches):
+        """
+        Process several segments' frame batches in one go so detection,
+        TrOCR and BLIP can batch across segments. Returns one
+        (text_fragments, image_captions) pair per input batch.
+
+        The work is split into plan/detect/recognize/caption/assemble steps
+        so the streaming pipeline can run each one in its own stage; steps
+        must be planned and assembled in order.
+        """
+        step = self.plan_step(frame_batches)
+        self.detect_step(step)
+        self.recognize_step(step)
+        self.caption_step(step)
+        return self.assemble_step(step)
+
+    def plan_step(self, frame_batches):
+        """Hash frames and decide which need processing. Returns the step dict the other steps fill in."""
+        batch_sources, new_frames = self._plan_frames(frame_batches)
+        return {"batch_sources": batch_sources, "frames": new_frames}
+
+    def detect_step(self, step):
+        step["pil_images"] = [Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) for frame in step["frames"]]
+        step["crops"], step["crop_records"] = self._detect_and_crop(step["frames"], step["pil_images"])
+        return step
+
+    def recognize_step(self, step):
+        crops, crop_records = step["crops"], step["crop_records"]
+        if self.ocr_mode == "cascade":
+            needs_htr = [i for i, record in enumerate(crop_records)
+                         if record["confidence"] < self.easyocr_min_confidence]
+        else:
+            needs_htr = list(range(len(crops)))
+
+        texts = [record["text"].strip() for record in crop_records]
+        for i, text in zip(needs_htr, self._recognize_regions([crops[i] for i in needs_htr])):
+            texts[i] = text
+        self.ocr_stats["trocr"] += len(needs_htr)
+        self.ocr_stats["easyocr"] += len(crops) - len(needs_htr)
+        step["texts"] = texts
+        step["crops"] = None  # crops are no longer needed; free them early
+        return step
+
+    def caption_step(self, step):
+        step["captions"] = self._caption_frames(step["frames"], step["pil_images"])
+        step["pil_images"] = None
+        return step
+
+    def assemble_step(self, step):
+        """Map texts/captions back to frames and merge them per input batch."""
+        results = [(set(), set()) for _ in step["frames"]]
+        for record, text in zip(step["crop_records"], step["texts"]):
+            if text and len(text) > 2: # Filter out small noise
+                results[record["frame"]][0].add(text)
+        for frame_idx, caption in enumerate(step["captions"]):
+            if caption and len(caption) > 5:
+                results[frame_idx][1].add(caption)
+
+        previous_results = self._last_frame_results
+        if results:
+            self._last_frame_results = results[-1]
+
+        outputs = []
+        for sources in step["batch_sources"]:
+            unique_text_fragments = set()
+            unique_image_captions = set()
+            for source in sources:
+                text_fragments, image_captions = previous_results if source < 0 else results[source]
+                unique_text_fragments.update(text_fragments)
+                unique_image_captions.update(image_captions)
+            outputs.append((list(unique_text_fragments), list(unique_image_captions)))
+                
+        return outputs
+
+    def _plan_frames(self, frame_batches):
+        """
+        Split frames into those that need processing and those whose slide has
+        not changed. Returns (batch_sources, new_frames): batch_sources[b][i]
+        indexes new_frames, or is -1 for the results cached from the previous call.
+        """
+        batch_sources = []
+        new_frames = []
+        last_source = -1
+        for frame_batch in frame_batches:
+            sources = []
+            for frame in frame_batch:
+                self.dedup_stats["frames"] += 1
+                thumbnail = self.slide_detector.thumbnail(frame) if self.slide_detector else None
+                if (thumbnail is not None and self._last_thumbnail is not None
+                        and self.slide_detector.is_same_slide(thumbnail, self._last_thumbnail)):
+                    self.dedup_stats["reused"] += 1
+                    sources.append(last_source)
+                    continue
+
+                new_frames.append(frame)
+                last_source = len(new_frames) - 1
+                self._last_thumbnail = thumbnail
+                sources.append(last_source)
+            batch_sources.append(sources)
+        return batch_sources, new_frames
+
+    def _detect_and_crop(self, frames, pil_images):
+        """Run text detection on each frame and crop every box. Returns (crops, records) where
+        records[i] = {"frame", "bbox": (x0, y0, x1, y1), "text", "confidence"} for crops[i],
+        text and confidence being easyocr's own recognition of the box."""
+        crops = []
+        crop_records = []
+        frame_detections = detect_text_boxes(frames, self._detect_text, self._update_content_region(frames),
+                                             self.detection_scale)
+        for frame_idx, (detections, pil_image) in enumerate(zip(frame_detections, pil_images)):
+            for (bbox, easyocr_text, confidence) in detections:
                 (tl, tr, br, bl) = bbox
                 x_min = int(min(tl[0], bl[0]))
                 y_min = int(min(tl[1], tr[1]))
                 x_max = int(max(tr[0], br[0]))
                 y_max = int(max(bl[1], br[1]))
                 padding = 2
-                cropped_image = pil_image.crop((
+                box = (
                     max(0, x_min - padding), 
                     max(0, y_min - padding), 
                     min(pil_image.width, x_max + padding), 
                     min(pil_image.height, y_max + padding)
-                ))
+                )
+                cropped_image = pil_image.crop(box)
 
                 if cropped_image.width > 10 and cropped_image.height > 10:
-                    pixel_values = self.htr_processor(cropped_image, return_tensors="pt").pixel_values.to(self.device)
-                    with torch.no_grad():
-                        outputs = self.htr_model.generate(pixel_values, max_length=128)
-                        
-                    text = self.htr_processor.batch_decode(outputs, skip_special_tokens=True)[0].strip()
-                        
-                    if text and len(text) > 2: # Filter out small noise
-                        unique_text_fragments.add(text)
-            caption_inputs = self.caption_processor(pil_image, return_tensors="pt").to(self.device)
+                    crops.append(cropped_image)
+                    crop_records.append({
+                        "frame": frame_idx,
+                        "bbox": box,
+                        "text": easyocr_text,
+                        "confidence": float(confidence)
+                    })
+        return crops, crop_records
+
+    def _detect_text(self, images):
+        if self.parallel_detector is not None:
+            return self.parallel_detector.detect(images)
+        return [self.text_detector.readtext(image, detail=1, paragraph=False) for image in images]
+
+    def _update_content_region(self, frames):
+        """Feed the lecture's first frames to the region finder; returns the region once it is known."""
+        finder = self.region_finder
+        if finder is None or finder.done:
+            return self.content_region
+        for frame in frames:
+            finder.add(frame)
+        if finder.done:
+            self.content_region = finder.find()
+            print(f"Content region for text detection: {self.content_region or 'full frame'}")
+        return self.content_region
+
+    def _caption_frames(self, frames, pil_images):
+        """
+        Caption frames with batched BLIP generate calls. Captions are cached
+        (LRU) since the same slide keeps coming back during a lecture: the
+        frame's perceptual hash picks a bucket, and a cached caption is only
+        reused if its frame passes the same changed-area test as slide dedup,
+        so slides sharing a template but not their content never share a
+        caption. Returns captions aligned with `frames`.
+        """
+        captions = [None] * len(frames)
+        misses = {}
+        for i, frame in enumerate(frames):
+            key = dhash(frame)
+            thumbnail = self.caption_matcher.thumbnail(frame)
+            cached = [caption for cached_thumbnail, caption in self._caption_cache.get(key, ())
+                      if self.caption_matcher.is_same_slide(thumbnail, cached_thumbnail)]
+            if cached:
+                self._caption_cache.move_to_end(key)
+                captions[i] = cached[-1]
+                self.caption_stats["cached"] += 1
+                continue
+            groups = misses.setdefault(key, [])
+            group = next((g for g in groups if self.caption_matcher.is_same_slide(thumbnail, g[0])), None)
+            if group is None:
+                groups.append((thumbnail, [i]))
+            else:
+                group[1].append(i)
+
+        pending = [(key, thumbnail, indices) for key, groups in misses.items() for thumbnail, indices in groups]
+        for start in range(0, len(pending), self.caption_batch_size):
+            batch = pending[start:start + self.caption_batch_size]
+            images = [pil_images[indices[0]] for _, _, indices in batch]
+            caption_inputs = self.caption_processor(images, return_tensors="pt").to(self.device)
             with torch.no_grad():
                 caption_ids = self.caption_model.generate(**caption_inputs, max_length=75)
-            caption = self.caption_processor.batch_decode(caption_ids, skip_special_tokens=True)[0].strip()
-            if caption and len(caption) > 5:
-                unique_image_captions.add(caption)
-                    
-                
-        return list(unique_text_fragments), list(unique_image_captions)
+            decoded = self.caption_processor.batch_decode(caption_ids, skip_special_tokens=True)
+            for (key, thumbnail, indices), caption in zip(batch, decoded):
+                caption = caption.strip()
+                for i in indices:
+                    captions[i] = caption
+                # A few distinct slides per hash bucket; older ones drop out first
+                entries = self._caption_cache.setdefault(key, [])
+                entries[:] = entries[-3:] + [(thumbnail, caption)]
+                self._caption_cache.move_to_end(key)
+                if len(self._caption_cache) > self.caption_cache_size:
+                    self._caption_cache.popitem(last=False)
+            self.caption_stats["generated"] += len(batch)
+        self.caption_stats["cached"] += sum(len(indices) - 1 for _, _, indices in pending)
+        return captions
+
+    def _recognize_regions(self, crops):
+        """
+        Recognize crops through an LRU cache keyed by each crop's perceptual
+        hash and size. On a board being written on, most boxes are unchanged
+        between samples even when the whole frame is not, so only new or
+        changed regions reach TrOCR. Returns texts aligned with `crops`.
+        """
+        texts = [None] * len(crops)
+        misses = {}
+        for i, crop in enumerate(crops):
+            # Finer hash for text crops, matched exactly, so a word that changed is always re-read
+            key = (dhash(np.asarray(crop), 16), crop.width // 8, crop.height // 8)
+            if key in self._region_cache:
+                self._region_cache.move_to_end(key)
+                texts[i] = self._region_cache[key]
+                self.region_stats["hits"] += 1
+            else:
+                misses.setdefault(key, []).append(i)
+
+        keys = list(misses)
+        recognized = self._recognize_crops([crops[misses[key][0]] for key in keys])
+        for key, text in zip(keys, recognized):
+            for i in misses[key]:
+                texts[i] = text
+            self._region_cache[key] = text
+            if len(self._region_cache) > self.region_cache_size:
+                self._region_cache.popitem(last=False)
+        self.region_stats["misses"] += len(keys)
+        self.region_stats["hits"] += sum(len(idx) - 1 for idx in misses.values())
+        return texts
+
+    def _recognize_crops(self, crops):
+        """
+        Recognize all crops with batched TrOCR generate calls. Crops are bucketed
+        by aspect ratio (a proxy for text length) so each batch decodes to
+        similar lengths. Returns texts aligned with `crops`.
+        """
+        texts = [""] * len(crops)
+        order = sorted(range(len(crops)), key=lambda i: crops[i].width / crops[i].height)
+
+        for start in range(0, len(order), self.htr_batch_size):
+            bucket = order[start:start + self.htr_batch_size]
+            pixel_values = self.htr_processor([crops[i] for i in bucket], return_tensors="pt").pixel_values.to(self.device)
+            with torch.no_grad():
+                outputs = self.htr_model.generate(pixel_values, max_length=128)
+            for i, text in zip(bucket, self.htr_processor.batch_decode(outputs, skip_special_tokens=True)):
+                texts[i] = text.strip()
+        return texts
 
     def combine_and_clean_info(self, text_list, caption_list):
         combined_text = " . ".join(sorted(caption_list) + sorted(text_list))
@@ -161,8 +161,9 @@ def download_book(bucket_name, course_name):
         print(f"No PDF files found in '{prefix}'")
 
 def filtered_images(target_dir = "segregated_images"):
-    with open("output/LectureCh10_metadata.json", "r", encoding="utf-8") as f:
-        data_image = json.load(f)
+    from MultiModal.book_metadata import load_book_metadata
+
+    book_metadata = load_book_metadata("output/LectureCh10")
 
     with open("merged_all_in_one_gemini.json","r",encoding="utf-8") as f:
         data_reference = json.load(f)
@@ -178,16 +179,11 @@ def filtered_images(target_dir = "segregated_images"):
 
     sorted_pages = sorted(page_numbers)
 
-    image_names = []
-
-    for el in data_image:
-        if int(el["page"]) in sorted_pages:
-            if el["images"]:
-                for image in el["images"]:
-                        image_names.append((image,int(el["page"])))
-            
+    # (image file path, page) for the referenced pages, looked up without loading every chunk
+    image_paths = book_metadata.images_on_pages(sorted_pages)
+    book_metadata.close()
+    image_names = [(os.path.basename(path), page) for path, page in image_paths]
 
-        
     print(image_names)
     if os.path.exists(target_dir):
         shutil.rmtree(target_dir)
@@ -196,9 +192,9 @@ def filtered_images(target_dir = "segregated_images"):
     images_passed = []
 
     copied = []
-    for image, page in image_names:
+    for source_path, page in image_paths:
+        image = os.path.basename(source_path)
         if image not in images_passed: 
-            source_path = os.path.join("output/book_images", image)
             if os.path.isfile(source_path):
                 shutil.copy2(source_path, os.path.join(target_dir, image))
                 copied.append(image)
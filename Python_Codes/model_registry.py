@@ -0,0 +1,117 @@
+import gc
+import threading
+
+
+def _load_sentence_transformer(name, device):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, device=device)
+
+
+def _load_asr_pipeline(name, device):
+    from transformers import pipeline
+    return pipeline("automatic-speech-recognition", model=name, device=device)
+
+
+def _load_easyocr_reader(name, device):
+    import easyocr
+    return easyocr.Reader([name], gpu=(device == "cuda"))
+
+
+def _load_trocr(name, device):
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+    # Force safetensors to avoid PyTorch 2.6 requirement
+    processor = TrOCRProcessor.from_pretrained(name, use_safetensors=True)
+    model = VisionEncoderDecoderModel.from_pretrained(name, use_safetensors=True).to(device)
+    return processor, model
+
+
+def _load_blip(name, device):
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+    processor = BlipProcessor.from_pretrained(name, use_safetensors=True)
+    model = BlipForConditionalGeneration.from_pretrained(name, use_safetensors=True).to(device)
+    return processor, model
+
+
+LOADERS = {
+    "sentence-transformer": _load_sentence_transformer,
+    "asr": _load_asr_pipeline,
+    "easyocr": _load_easyocr_reader,
+    "trocr": _load_trocr,
+    "blip": _load_blip,
+}
+
+
+def get_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models shared by every pipeline component.
+
+    Models are loaded lazily on the first acquire() of a (kind, name, device)
+    key and reference counted. release() only drops a reference; memory is
+    freed by an explicit unload() / unload_unused(), so a model stays warm
+    between components (and lectures) until the caller decides otherwise.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models = {}
+        self._refcounts = {}
+
+    def acquire(self, kind, name, device):
+        key = (kind, name, device)
+        with self._lock:
+            if key not in self._models:
+                print(f"Loading {kind} model ({name}) on {device}...")
+                self._models[key] = LOADERS[kind](name, device)
+                self._refcounts[key] = 0
+            self._refcounts[key] += 1
+            return self._models[key]
+
+    def release(self, kind, name, device):
+        key = (kind, name, device)
+        with self._lock:
+            if self._refcounts.get(key, 0) > 0:
+                self._refcounts[key] -= 1
+
+    def unload(self, kind, name, device, force=False):
+        """Drop a loaded model. Refuses while it is still referenced unless force=True."""
+        key = (kind, name, device)
+        with self._lock:
+            if key not in self._models:
+                return False
+            if self._refcounts[key] > 0 and not force:
+                print(f"⚠ Not unloading {name}: still used by {self._refcounts[key]} component(s)")
+                return False
+            del self._models[key]
+            del self._refcounts[key]
+        self._free_memory()
+        print(f"Unloaded {kind} model ({name})")
+        return True
+
+    def unload_unused(self):
+        with self._lock:
+            unused = [key for key, count in self._refcounts.items() if count == 0]
+        for key in unused:
+            self.unload(*key)
+        return len(unused)
+
+    def loaded(self):
+        """Return {(kind, name, device): refcount} for every loaded model."""
+        with self._lock:
+            return dict(self._refcounts)
+
+    def _free_memory(self):
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+registry = ModelRegistry()
@@ -0,0 +1,102 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-worker state, set up once by _init_worker
+_reader = None
+_attached = None
+
+
+def _init_worker(lang, device, num_threads):
+    """Worker initializer: cap torch threads so workers don't oversubscribe cores, then load easyocr once."""
+    global _reader
+    import torch
+    from model_registry import registry
+
+    torch.set_num_threads(num_threads)
+    _reader = registry.acquire("easyocr", lang, device)
+
+
+def _frame_view(shm_name, offset, shape):
+    """View one frame inside the parent's shared buffer, re-attaching only when the buffer changes."""
+    global _attached
+    if _attached is None or _attached.name != shm_name:
+        if _attached is not None:
+            _attached.close()
+        _attached = shared_memory.SharedMemory(name=shm_name)
+    return np.ndarray(shape, dtype=np.uint8, buffer=_attached.buf, offset=offset)
+
+
+def _detect_frame(task):
+    shm_name, offset, shape = task
+    frame = _frame_view(shm_name, offset, shape)
+    detections = _reader.readtext(frame, detail=1, paragraph=False)
+    # Only boxes, text and confidence go back; the frame itself never leaves shared memory
+    return [([(int(x), int(y)) for x, y in bbox], text, float(confidence))
+            for bbox, text, confidence in detections]
+
+
+class ParallelTextDetector:
+    """
+    easyocr text detection sharded across a pool of worker processes, each
+    holding its own Reader loaded once in the worker initializer.
+
+    Frames are copied once into a shared-memory buffer owned by this object
+    (grown as needed and reused between calls); workers read them in place
+    and return only (bbox, text, confidence) tuples, so no frame arrays are
+    pickled. detect() returns easyocr's readtext(detail=1) result per frame.
+
+    `thread_budget` is the total number of torch threads the workers share
+    (default: the calling process's torch.get_num_threads(), i.e. its own
+    budget, not the whole machine); there are never more workers than threads.
+    """
+
+    def __init__(self, workers, lang="en", device="cpu", thread_budget=None):
+        if thread_budget is None:
+            import torch
+            thread_budget = torch.get_num_threads()
+        workers = max(1, min(workers, thread_budget))
+        threads_per_worker = max(1, thread_budget // workers)
+        self.workers = workers
+        # spawn, not fork: torch's thread pools do not survive a fork
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(lang, device, threads_per_worker)
+        )
+        self._shm = None
+
+    def detect(self, frames):
+        if not frames:
+            return []
+        frames = [np.ascontiguousarray(frame, dtype=np.uint8) for frame in frames]
+        buffer = self._ensure_buffer(sum(frame.nbytes for frame in frames))
+
+        tasks = []
+        offset = 0
+        for frame in frames:
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=buffer.buf, offset=offset)[...] = frame
+            tasks.append((buffer.name, offset, frame.shape))
+            offset += frame.nbytes
+
+        # One frame per task keeps every worker busy; map returns results in frame order
+        return list(self.pool.map(_detect_frame, tasks))
+
+    def _ensure_buffer(self, nbytes):
+        if self._shm is None or self._shm.size < nbytes:
+            self._release_buffer()
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return self._shm
+
+    def _release_buffer(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self.pool.shutdown()
+        self._release_buffer()
@@ -1,171 +1,558 @@
-import numpy as np
-import torch
-from pathlib import Path
-from tqdm import tqdm 
-import sys
-from frames_embeddings import VideoTextExtractor
-from audio_embeddings import AudioVectorizer
-from pipeline_functions import *
-from MultiModal.generate import *
-from MultiModal.pdf_embedding import *
-from MultiModal.lecture_to_bookmatch import *
+"""
+Smart Scribes lecture pipeline.
+
+Run everything for the course backlog with `python pipeline.py` (or
+`python pipeline.py run`), or run a single stage with one of the subcommands
+below. Every stage imports only the modules it needs, so `--help` or a
+publish-only rerun does not load the whole ML stack.
+
+    transcribe  audio -> audio_transcripts.json
+    frames      video -> video_texts.json
+    stream      transcribe + frames as one bounded streaming pipeline
+    fuse        transcripts + video texts -> full_data.json, *_embeddings.npy
+    book        course PDF -> book embeddings
+    match       lecture embeddings <-> book chunks -> lecture_book_matches.json
+    summarize   matches -> all_data.txt, final.json
+    animate     all_data.txt -> smart_scribes_animations/, results.json
+    publish     merge, upload and push to the frontend
+"""
+import argparse
+import itertools
 import json
-from manim2 import *
-from google_storage_code import *
+import multiprocessing
 import os
-from create_json import *
-from lastjson import *
-from cleaning import *
-from UploadTOFrontend import *
+import queue
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
 
 
-local_dir_audio = "audio_full" 
+local_dir_audio = "audio_full"
 local_dir_video = "video_full"
 OUTPUT_FUSED_FILE = "fused_final.npy"
 OUTPUT_AUDIO_FILE = "audio_embeddings.npy"
 OUTPUT_VIDEO_FILE = "video_embeddings.npy"
 FULL_JSON = "full_data.json"
+TRANSCRIPTS_JSON = "audio_transcripts.json"
+TRANSCRIPTS_PARTIAL = "audio_transcripts.partial.jsonl"  # transcripts written so far, one JSON line per segment
+VIDEO_TEXTS_JSON = "video_texts.json"
+BOOK_PDF = "book/LectureCh10.pdf"
+BOOK_NAME = "LectureCh10"
+BOOK_EMBEDDINGS = "book_embeddings/Stative_Verbs_List"
+BOOK_EMBED_MODE = "in_memory"  # "in_memory" or "streaming" (bounded memory, resumable; for very large books)
+BOOK_EMBED_BATCH_SIZE = 256  # chunks per embedding batch in streaming mode
+BOOK_EXTRACT_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # processes extracting PDF pages
 VIDEO_DIM = 384
 AUDIO_DIM = 384
+ASR_BATCH_SIZE = 8
+EMBEDDING_BATCH_SIZE = 64
+ASR_MODE = "batched"  # "batched" (per 10s segment) or "long_form" (strided, timestamped)
+ASR_WINDOW_SEGMENTS = 30  # segments per long-form Whisper window (audio held at once in long-form mode)
+VAD_ENABLED = True
+CLEAN_BLOCK_SECONDS = 30
+CLEAN_NORMALIZE = "two_pass"  # "two_pass" (global peak) or "running" (no spool, but loudness drifts; see clean_audio_stream)
+CLEAN_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+OCR_DETECTOR_WORKERS = max(1, (os.cpu_count() or 1) // 4)  # easyocr detection processes (CPU only; 1 = in-process)
+OCR_DETECTOR_THREADS = None  # torch threads shared by the detection processes (None = half the caller's budget)
+OCR_MODE = "cascade"  # "cascade" (easyocr first, TrOCR for low confidence) or "trocr"
+CAPTION_MODEL = "large"  # BLIP tier: "large" or the cheaper "base"
+SEGMENT_SECONDS = 10  # length of one audio segment; video frames are batched to match
+VIDEO_FPS = 0.2
+VIDEO_SCALE = 1.0  # resize factor applied by FFmpeg while decoding
+DETECTION_SCALE = 1.0  # downscale for easyocr detection; pick it with `pipeline.py bench-detection`
+ROI_FRAMES = 0  # frames sampled per lecture to find the slide region (0 = whole frame); enable once bench-detection shows no recall loss
+VIDEO_SEGMENTS_PER_STEP = 8  # segments whose frames are OCR'd/captioned together
+EXECUTION_MODE = "streaming"  # "streaming" (bounded staged pipeline), "processes" (one process per branch) or "serial"
+STREAM_QUEUE_SIZE = 4  # max items waiting between two streaming stages
+AUDIO_BRANCH_THREADS = max(1, (os.cpu_count() or 1) // 2)  # torch threads for the audio branch process
+VIDEO_BRANCH_THREADS = max(1, (os.cpu_count() or 1) - AUDIO_BRANCH_THREADS)  # torch threads for the video branch process
 BUCKET_NAME = "smartscribe_input"
 
-def run_pipeline(task):
-    download_lecture_files(BUCKET_NAME, task[0], task[1])
-    download_book(BUCKET_NAME,task[0])
+# Modules each stage imports, used by the startup benchmark
+STAGE_MODULES = {
+    "transcribe": ["audio_embeddings"],
+    "frames": ["frames_embeddings", "ocr_detection", "pipeline_functions"],
+    "stream": ["audio_embeddings", "frames_embeddings", "pipeline_functions", "streaming_pipeline"],
+    "fuse": ["embedding_stage", "model_registry", "cleaning"],
+    "book": ["MultiModal.pdf_embedding"],
+    "match": ["MultiModal.lecture_to_bookmatch"],
+    "summarize": ["MultiModal.generate", "create_json"],
+    "animate": ["manim2"],
+    "publish": ["lastjson", "google_storage_code", "UploadTOFrontend"],
+}
+
+
+def find_lecture_files():
     file_video = os.listdir(local_dir_video)
     file_audio = os.listdir(local_dir_audio)
-    AUDIO_SNIPPET_FILE = os.path.join(local_dir_audio, file_audio[0])
-    VIDEO_SNIPPET_FILE = os.path.join(local_dir_video, file_video[0])
-
-    print("\nLoading all models... (This may take a moment)")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(device)
-            
-    video_extractor = VideoTextExtractor()
-    audio_vectorizer = AudioVectorizer()
-            
-    print(f"All models loaded successfully. Using device: {device}")
-
-        # --- 5. Pre-process Audio & Video ---
-    print("\nPre-processing audio...")
-    audio, sr = audio_vectorizer.load_audio(AUDIO_SNIPPET_FILE)
-    cleaned_audio = audio_vectorizer.clean_audio(audio,sr)
-    audio_segments = audio_vectorizer.split_audio(cleaned_audio, sr)
-    print(f"Audio pre-processed into {len(audio_segments)} 10-second segments.")
+    return os.path.join(local_dir_audio, file_audio[0]), os.path.join(local_dir_video, file_video[0])
+
+
+def frames_per_segment():
+    """Frames sampled per SEGMENT_SECONDS at VIDEO_FPS, so video batch i covers the same time as transcript i."""
+    frames = VIDEO_FPS * SEGMENT_SECONDS
+    if round(frames) < 1 or abs(frames - round(frames)) > 1e-6:
+        raise ValueError(f"VIDEO_FPS={VIDEO_FPS} must sample a whole number (>= 1) of frames "
+                         f"per {SEGMENT_SECONDS}s segment")
+    return round(frames)
+
+
+def make_video_extractor():
+    from frames_embeddings import VideoTextExtractor
+    return VideoTextExtractor(ocr_mode=OCR_MODE, caption_model=CAPTION_MODEL, detector_workers=OCR_DETECTOR_WORKERS,
+                              detection_scale=DETECTION_SCALE, roi_frames=ROI_FRAMES,
+                              detector_threads=OCR_DETECTOR_THREADS)
+
+
+def stream_audio_segments(audio_vectorizer, audio_file, clean_workers=None):
+    """
+    Lazily decode, clean and split the lecture audio. Yields split_audio
+    (k, samples) arrays of up to ASR_BATCH_SIZE SEGMENT_SECONDS segments,
+    one micro-batch each.
+    """
+    sr = audio_vectorizer.SAMPLE_RATE
+    return audio_vectorizer.split_audio_stream(
+        audio_vectorizer.clean_audio_stream(
+            audio_vectorizer.stream_audio(audio_file, chunk_seconds=CLEAN_BLOCK_SECONDS),
+            sr,
+            block_seconds=CLEAN_BLOCK_SECONDS,
+            normalize=CLEAN_NORMALIZE,
+            workers=CLEAN_WORKERS if clean_workers is None else clean_workers
+        ),
+        sr,
+        segment_length=SEGMENT_SECONDS,
+        block_segments=ASR_BATCH_SIZE
+    )
+
+
+def detect_voiced(audio_vectorizer, segment_batch):
+    """VAD for one micro-batch of segments. Returns (segments, voiced_mask), the mask None when VAD is off."""
+    if not VAD_ENABLED:
+        return segment_batch, None
+    return segment_batch, audio_vectorizer.detect_voiced_segments(segment_batch, audio_vectorizer.SAMPLE_RATE,
+                                                                  report=False)
+
+
+def transcribe_micro_batch(audio_vectorizer, item):
+    segments, voiced = item
+    transcripts = audio_vectorizer.transcribe_batch(segments, audio_vectorizer.SAMPLE_RATE,
+                                                    batch_size=ASR_BATCH_SIZE, voiced_mask=voiced)
+    return transcripts, voiced
 
+
+def transcribe_voiced(audio_vectorizer, segment_batches):
+    """Transcribe (segments, voiced_mask) micro-batches as they arrive; yields (transcripts, voiced_mask) runs."""
+    if ASR_MODE == "long_form":
+        return audio_vectorizer.transcribe_long_form_stream(
+            segment_batches, audio_vectorizer.SAMPLE_RATE, segment_length=SEGMENT_SECONDS,
+            window_segments=ASR_WINDOW_SEGMENTS, batch_size=ASR_BATCH_SIZE
+        )
+    return (transcribe_micro_batch(audio_vectorizer, item) for item in segment_batches)
+
+
+def collect_transcripts(results):
+    """
+    Gather (transcripts, voiced_mask) runs in segment order. Each run is
+    appended to TRANSCRIPTS_PARTIAL as soon as it arrives, so finished
+    transcripts are on disk while the rest of the lecture is still being
+    transcribed. Returns (transcripts, voiced_mask or None).
+    """
+    import numpy as np
+
+    transcripts = []
+    voiced = []
+    with open(TRANSCRIPTS_PARTIAL, "w", encoding="utf-8") as partial:
+        for run_transcripts, run_voiced in results:
+            if run_voiced is None:
+                run_voiced = [None] * len(run_transcripts)
+            for text, is_voiced in zip(run_transcripts, run_voiced):
+                is_voiced = None if is_voiced is None else bool(is_voiced)
+                partial.write(json.dumps({"transcript": text, "voiced": is_voiced}, ensure_ascii=False) + "\n")
+                voiced.append(is_voiced)
+            partial.flush()
+            transcripts.extend(run_transcripts)
+    if not voiced or any(v is None for v in voiced):
+        return transcripts, None
+    return transcripts, np.array(voiced, dtype=bool)
+
+
+def transcribe_stage(audio_file, audio_vectorizer=None, clean_workers=None):
+    """Clean, split and transcribe the lecture audio in micro-batches. Returns (transcripts, voiced_mask)."""
+    from audio_embeddings import AudioVectorizer
+
+    owns_model = audio_vectorizer is None
+    if owns_model:
+        audio_vectorizer = AudioVectorizer()
+
+    # Segments are pulled from the decoder one micro-batch at a time, so memory does not grow with the lecture
+    print("\nPre-processing and transcribing audio...")
+    segment_batches = (detect_voiced(audio_vectorizer, batch)
+                       for batch in stream_audio_segments(audio_vectorizer, audio_file, clean_workers))
+    audio_transcripts, voiced_mask = collect_transcripts(transcribe_voiced(audio_vectorizer, segment_batches))
+    print(f"Audio transcribed in {len(audio_transcripts)} {SEGMENT_SECONDS}-second segments.")
+    if voiced_mask is not None:
+        audio_vectorizer.report_vad(voiced_mask, SEGMENT_SECONDS)
+
+    if owns_model:
+        audio_vectorizer.close()
+
+    return save_transcripts(audio_transcripts, voiced_mask)
+
+
+def save_transcripts(audio_transcripts, voiced_mask):
+    voiced = [bool(v) for v in voiced_mask] if voiced_mask is not None else None
+    with open(TRANSCRIPTS_JSON, "w", encoding="utf-8") as f:
+        json.dump({"transcripts": audio_transcripts, "voiced": voiced}, f, ensure_ascii=False, indent=2)
+    if os.path.exists(TRANSCRIPTS_PARTIAL):
+        os.remove(TRANSCRIPTS_PARTIAL)
+    return audio_transcripts, voiced
+
+
+def save_video_texts(video_texts):
+    with open(VIDEO_TEXTS_JSON, "w", encoding="utf-8") as f:
+        json.dump(video_texts, f, ensure_ascii=False, indent=2)
+    return video_texts
+
+
+def frames_stage(video_file, video_extractor=None, max_segments=None):
+    """Extract OCR text and captions for each segment's batch of video frames. Returns the video texts."""
+    from tqdm import tqdm
+    from pipeline_functions import stream_frames_with_ffmpeg, create_batches
+
+    owns_model = video_extractor is None
+    if owns_model:
+        video_extractor = make_video_extractor()
+
+    batch_size = frames_per_segment()
     print("\nPre-processing video...")
-    frame_folder = preprocess_video_with_ffmpeg(VIDEO_SNIPPET_FILE, target_fps=0.2)
-    frame_gen = load_frames_from_folder(frame_folder)
-    video_batches = list(create_batches(frame_gen, batch_size=2))
-    print(f"Video pre-processed into {len(video_batches)} 2-frame batches.")
-                
-    num_segments = min(len(video_batches), len(audio_segments))
+    frame_gen = stream_frames_with_ffmpeg(video_file, target_fps=VIDEO_FPS, scale=VIDEO_SCALE)
+    video_batches = create_batches(frame_gen, batch_size=batch_size)
+    if max_segments is not None:
+        video_batches = itertools.islice(video_batches, max_segments)
+
+    video_extractor.reset_lecture_state()
+    video_texts = []
+    for step_batches in tqdm(create_batches(video_batches, VIDEO_SEGMENTS_PER_STEP), desc="Extracting Video Text"):
+        for text_fragments, image_captions in video_extractor.extract_info_from_batches(step_batches):
+            cleaned_text = video_extractor.combine_and_clean_info(text_fragments, image_captions)
+            print(cleaned_text)
+            video_texts.append(cleaned_text)
+    frame_gen.close()
+    print(f"Video processed into {len(video_texts)} {batch_size}-frame batches.")
+    video_extractor.report_stats()
+
+    if owns_model:
+        video_extractor.close()
+
+    return save_video_texts(video_texts)
+
+
+def streaming_stage(audio_file, video_file, audio_vectorizer=None, video_extractor=None):
+    """
+    Streaming replacement for transcribe_stage + frames_stage. Both branches
+    run as bounded producer/consumer pipelines at the same time:
+
+        video: decode (ffmpeg) -> plan -> detect -> recognize -> caption -> assemble
+        audio: decode/clean/split -> vad -> transcribe (Whisper micro-batches;
+               long-form windows are transcribed by the consuming thread)
+
+    Every stage has its own thread and bounded input queue, so decoding
+    overlaps model inference and memory stays flat for long lectures.
+    Returns (transcripts, voiced_mask, video_texts).
+    """
+    import threading
+    from audio_embeddings import AudioVectorizer
+    from pipeline_functions import stream_frames_with_ffmpeg, create_batches
+    from streaming_pipeline import BoundedPipeline
+
+    batch_size = frames_per_segment()
+    owns_audio = audio_vectorizer is None
+    if owns_audio:
+        audio_vectorizer = AudioVectorizer()
+    owns_video = video_extractor is None
+    if owns_video:
+        video_extractor = make_video_extractor()
+
+    # --- Audio branch ---
+    audio_result = []
+    audio_errors = []
+    audio_pipeline = BoundedPipeline("audio", max_queue=STREAM_QUEUE_SIZE).add_stage(
+        "vad", lambda segment_batch: detect_voiced(audio_vectorizer, segment_batch)
+    )
+    if ASR_MODE != "long_form":
+        audio_pipeline.add_stage("transcribe", lambda item: transcribe_micro_batch(audio_vectorizer, item))
+
+    def consume_audio():
+        try:
+            results = audio_pipeline.run(stream_audio_segments(audio_vectorizer, audio_file))
+            if ASR_MODE == "long_form":
+                # Long-form windows span several micro-batches, so Whisper runs on this thread instead of a stage
+                results = transcribe_voiced(audio_vectorizer, results)
+            audio_result.extend(collect_transcripts(results))
+        except Exception as e:
+            audio_errors.append(e)
+
+    audio_thread = threading.Thread(target=consume_audio, name="audio-branch")
+    audio_thread.start()
+
+    # --- Video branch ---
+    print("\nStreaming video through OCR/caption stages...")
+    video_extractor.reset_lecture_state()
+    frame_gen = stream_frames_with_ffmpeg(video_file, target_fps=VIDEO_FPS, scale=VIDEO_SCALE)
+    video_steps = create_batches(create_batches(frame_gen, batch_size=batch_size), VIDEO_SEGMENTS_PER_STEP)
+    video_pipeline = (BoundedPipeline("video", max_queue=STREAM_QUEUE_SIZE)
+                      .add_stage("plan", video_extractor.plan_step)
+                      .add_stage("detect", video_extractor.detect_step)
+                      .add_stage("recognize", video_extractor.recognize_step)
+                      .add_stage("caption", video_extractor.caption_step)
+                      .add_stage("assemble", video_extractor.assemble_step))
+
+    video_texts = []
+    try:
+        for step_outputs in video_pipeline.run(video_steps):
+            for text_fragments, image_captions in step_outputs:
+                cleaned_text = video_extractor.combine_and_clean_info(text_fragments, image_captions)
+                print(cleaned_text)
+                video_texts.append(cleaned_text)
+    finally:
+        audio_thread.join()
+    if audio_errors:
+        raise audio_errors[0]
+
+    audio_transcripts, voiced_mask = audio_result
+    print(f"Video processed into {len(video_texts)} {batch_size}-frame batches; "
+          f"audio into {len(audio_transcripts)} segments.")
+    video_pipeline.report()
+    video_extractor.report_stats()
+    audio_pipeline.report()
+    if voiced_mask is not None:
+        audio_vectorizer.report_vad(voiced_mask, SEGMENT_SECONDS)
+
+    if owns_audio:
+        audio_vectorizer.close()
+    if owns_video:
+        video_extractor.close()
+
+    audio_transcripts, voiced_mask = save_transcripts(audio_transcripts, voiced_mask)
+    return audio_transcripts, voiced_mask, save_video_texts(video_texts)
+
+
+_branch_model = None
+
+
+def _init_branch_process(branch, num_threads):
+    """Branch process initializer: pin its torch thread budget and load its models once."""
+    global _branch_model
+    import torch
+    from audio_embeddings import AudioVectorizer
+
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    print(f"{branch} branch process {os.getpid()}: {num_threads} torch threads")
+    _branch_model = AudioVectorizer() if branch == "audio" else make_video_extractor()
+
+
+def _warm_up_branch():
+    """No-op task: running it makes the pool start its process, whose initializer loads the models."""
+    return _branch_model is not None
+
+
+def _audio_branch(audio_file):
+    # Cleaning workers come out of this branch's budget rather than the whole machine's
+    return transcribe_stage(audio_file, _branch_model, clean_workers=min(CLEAN_WORKERS, AUDIO_BRANCH_THREADS))
+
+
+def _video_branch(video_file):
+    return frames_stage(video_file, _branch_model)
+
+
+class BranchProcesses:
+    """
+    The audio branch (load, clean, split, Whisper) and the video branch
+    (frames, OCR, captions) each in a long-lived process of its own with a
+    separate torch thread budget. Models load once per process, so the pair
+    can be reused across lectures like LectureWorker's in-process models.
+
+    Both branches run at the same time; run() waits for both and returns
+    (transcripts, voiced_mask, video_texts) for fuse_stage to join on
+    segment index.
+    """
+
+    def __init__(self, audio_threads=AUDIO_BRANCH_THREADS, video_threads=VIDEO_BRANCH_THREADS):
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn, not fork: CUDA and torch's thread pools do not survive a fork
+        context = multiprocessing.get_context("spawn")
+        self.audio_pool = ProcessPoolExecutor(
+            max_workers=1, mp_context=context,
+            initializer=_init_branch_process, initargs=("audio", audio_threads)
+        )
+        self.video_pool = ProcessPoolExecutor(
+            max_workers=1, mp_context=context,
+            initializer=_init_branch_process, initargs=("video", video_threads)
+        )
+
+    def warm_up(self):
+        """Start both processes and wait until their models are loaded, instead of on the first lecture."""
+        futures = [self.audio_pool.submit(_warm_up_branch), self.video_pool.submit(_warm_up_branch)]
+        for future in futures:
+            future.result()
+
+    def run(self, audio_file, video_file):
+        start = time.perf_counter()
+        audio_future = self.audio_pool.submit(_audio_branch, audio_file)
+        video_future = self.video_pool.submit(_video_branch, video_file)
+        audio_transcripts, voiced_mask = audio_future.result()
+        print(f"Audio branch done after {time.perf_counter() - start:.1f}s")
+        video_texts = video_future.result()
+        print(f"Video branch done after {time.perf_counter() - start:.1f}s")
+        return audio_transcripts, voiced_mask, video_texts
+
+    def close(self):
+        self.audio_pool.shutdown()
+        self.video_pool.shutdown()
+
+
+def fuse_stage(audio_transcripts, voiced_mask, video_texts):
+    """Embed transcripts and video texts in batches and write full_data.json plus the .npy files."""
+    from embedding_stage import DeferredEmbeddingStage
+    from model_registry import registry, get_device
+    from cleaning import clean_transcript_file
+
+    num_segments = min(len(video_texts), len(audio_transcripts))
     if num_segments == 0:
         print("Error: No segments found to process.")
-        sys.exit(1)
-                    
+        raise RuntimeError("No segments found to process")
+
     print(f"\n--- Starting full processing for {num_segments} segments ---")
 
-    fused_vectors = []  # List to collect fused vectors
-    audio_embeddings_all = []  # Store audio vectors
-    video_embeddings = []  # Store video vectors
+    model_key = ("sentence-transformer", "all-MiniLM-L6-v2", get_device())
+    embedding_stage = DeferredEmbeddingStage(
+            registry.acquire(*model_key),
+            audio_dim=AUDIO_DIM,
+            video_dim=VIDEO_DIM,
+            batch_size=EMBEDDING_BATCH_SIZE
+    )
 
     audio_data = {}
 
-    for i in tqdm(range(num_segments), desc="Processing & Fusing Segments"):
-        video_batch = video_batches[i]
-        audio_segment = audio_segments[i]
-                    
-        text_fragments, image_captions = video_extractor.extract_info_from_batch(video_batch)
-        cleaned_text = video_extractor.combine_and_clean_info(text_fragments, image_captions)
-        print(cleaned_text)
-                    
-        if cleaned_text:
-                video_vec_np = video_extractor.get_text_embedding(cleaned_text)
-        else:
-                video_vec_np = np.zeros(VIDEO_DIM) 
-                
-        audio_text_new, audio_embeddings = audio_vectorizer.get_transcript_embedding(audio_segment,sr)
-            
-        audio_vec_np = np.array(audio_embeddings)
-        v_interaction = audio_vec_np * video_vec_np
-        v_fused = np.concatenate((audio_vec_np, video_vec_np, v_interaction))
-            
-        fused_vectors.append(v_fused)
-        audio_embeddings_all.append(audio_vec_np)
-        video_embeddings.append(video_vec_np)
+    for i in range(num_segments):
+        silent = voiced_mask is not None and not voiced_mask[i]
+        # A silent segment gets a zero embedding, so it must not keep text either
+        audio_text_new = "" if silent else audio_transcripts[i]
+        cleaned_text = video_texts[i]
+        embedding_stage.add_segment(audio_text_new, cleaned_text, silent=silent)
 
         audio_data[f"segment_{i+1}"] = {
                 "transcript": audio_text_new.strip(),
                 "video_text": cleaned_text.strip(),
         }
 
+    embedding_stage.run()
+    registry.release(*model_key)
+
     with open(FULL_JSON, "w", encoding="utf-8") as f:
         json.dump(audio_data, f, ensure_ascii=False, indent=4)
 
-    np.save(OUTPUT_FUSED_FILE, np.stack(fused_vectors))
-    np.save(OUTPUT_AUDIO_FILE, np.stack(audio_embeddings_all))
-    np.save(OUTPUT_VIDEO_FILE, np.stack(video_embeddings))
+    embedding_stage.save(OUTPUT_FUSED_FILE, OUTPUT_AUDIO_FILE, OUTPUT_VIDEO_FILE)
 
     clean_transcript_file(
     input_path="full_data.json",
     output_path="full_data.json"
     )
 
-    clean_directory("output/book_images")
 
-    book_processor = BookEmbeddingProcessor()
-    chunks = book_processor.chunk_and_embed_book(
-            "book/LectureCh10.pdf",
-            "LectureCh10"
-    )
-    book_processor.save_book_embeddings(chunks, "book_embeddings/Stative_Verbs_List")
-    print(f"✅ Book embeddings created: {len(chunks)} chunks")
+def book_stage(pdf_path=BOOK_PDF, book_name=BOOK_NAME):
+    from MultiModal.pdf_embedding import BookEmbeddingProcessor
+
+    # Every lecture of a course shares the book, so this is normally a cache hit
+    book_processor = BookEmbeddingProcessor(extract_workers=BOOK_EXTRACT_WORKERS)
+    if BOOK_EMBED_MODE == "streaming":
+        base_path = book_processor.stream_chunk_and_embed_book(pdf_path, book_name, batch_size=BOOK_EMBED_BATCH_SIZE)
+        os.makedirs(os.path.dirname(BOOK_EMBEDDINGS), exist_ok=True)
+        for suffix in ("_embeddings.npy", "_metadata.sqlite"):
+            shutil.copyfile(f"{base_path}{suffix}", f"{BOOK_EMBEDDINGS}{suffix}")
+        print(f"✅ Book embeddings created → {BOOK_EMBEDDINGS}")
+    else:
+        chunks = book_processor.chunk_and_embed_book(
+                pdf_path,
+                book_name
+        )
+        book_processor.save_book_embeddings(chunks, BOOK_EMBEDDINGS)
+        print(f"✅ Book embeddings created: {len(chunks)} chunks")
+    book_processor.close()
+
+
+def match_stage():
+    from MultiModal.lecture_to_bookmatch import LectureBookMatcher
 
-        # Step 2: Match lecture segments
     print("\n" + "=" * 80)
     print("Step 2: Matching lecture with book content...")
     print("=" * 80)
     matcher = LectureBookMatcher(
             similarity_threshold=0.3,
-            seconds_per_embedding=10,
+            seconds_per_embedding=SEGMENT_SECONDS,
             segment_duration_minutes=5
     )
-    matcher.load_book_database("book_embeddings/Stative_Verbs_List")
+    matcher.load_book_database(BOOK_EMBEDDINGS)
 
     matcher.load_full_data(FULL_JSON)
 
     segment_matches = matcher.process_lecture_segments(
-            fused_embeddings_path="fused_final.npy",
-            video_embeddings_path="video_embeddings.npy"
+            fused_embeddings_path=OUTPUT_FUSED_FILE,
+            video_embeddings_path=OUTPUT_VIDEO_FILE
     )
 
     with open("lecture_book_matches.json", 'w', encoding='utf-8') as f:
             json.dump(segment_matches, f, indent=2)
 
     print(f"✅ Matched {len(segment_matches)} segments with book content")
+    return segment_matches
+
+
+def summarize_stage(segment_matches=None):
+    from MultiModal.generate import LectureDocumentGenerator
+    from create_json import GeminiLectureProcessor
+
+    if segment_matches is None:
+        with open("lecture_book_matches.json", 'r', encoding='utf-8') as f:
+            segment_matches = json.load(f)
 
     print("\n" + "=" * 80)
     print("Step 3: Generating comprehensive lecture document...")
     print("=" * 80)
     doc_generator = LectureDocumentGenerator()
-    final_document = doc_generator.generate_full_document(
+    doc_generator.generate_full_document(
             segment_matches,
             output_path="all_data.txt"
     )
 
+    processor = GeminiLectureProcessor("all_data.txt")
+    processor.run()
+
+
+def animate_stage():
+    from manim2 import SmartScribesUltimateAgent
+    from pipeline_functions import clean_directory
+
     clean_directory("smart_scribes_animations")
 
-    file = "all_data.txt"    
+    file = "all_data.txt"
     agent = SmartScribesUltimateAgent()
     result = agent.generate_animations_from_lecture(file)
     if result['success']:
             print("\n✨ Done! Check smart_scribes_animations/")
 
-    
 
-    processor = GeminiLectureProcessor("all_data.txt")
-    processor.run()
+def publish_stage(task):
+    from lastjson import gemini_merge_all
+    from google_storage_code import (update_json_and_upload_video, create_json_and_upload_images,
+                                     add_overall_url, add_overall_id, rename_json_file,
+                                     convert_dict_json_to_array_json)
+    from UploadTOFrontend import run_code
 
     summary_path = "final.json"
     animations_path = "results.json"
@@ -177,15 +564,357 @@ def run_pipeline(task):
     create_json_and_upload_images(BUCKET_NAME,task[0],task[1])
     add_overall_url()
     add_overall_id(task[0],task[1])
-    rename_json_file() 
+    rename_json_file()
     convert_dict_json_to_array_json()
     run_code()
 
+
+def run_pipeline(task, video_extractor=None, audio_vectorizer=None, branches=None):
+    """
+    Run the full pipeline for one (course, lecture) task. Pass already-loaded
+    extractors (see LectureWorker) to skip model loading; otherwise each
+    stage loads and releases its own. In "processes" mode pass a running
+    BranchProcesses instead.
+    """
+    from google_storage_code import download_lecture_files, download_book
+
+    download_lecture_files(BUCKET_NAME, task[0], task[1])
+    download_book(BUCKET_NAME,task[0])
+    audio_file, video_file = find_lecture_files()
+
+    if EXECUTION_MODE == "streaming":
+        audio_transcripts, voiced_mask, video_texts = streaming_stage(
+            audio_file, video_file, audio_vectorizer, video_extractor
+        )
+    elif EXECUTION_MODE == "processes":
+        owns_branches = branches is None
+        if owns_branches:
+            branches = BranchProcesses()
+        try:
+            # The video branch cannot see the audio segment count, so fuse_stage trims to the shorter side
+            audio_transcripts, voiced_mask, video_texts = branches.run(audio_file, video_file)
+        finally:
+            if owns_branches:
+                branches.close()
+    else:
+        audio_transcripts, voiced_mask = transcribe_stage(audio_file, audio_vectorizer)
+        video_texts = frames_stage(video_file, video_extractor, max_segments=len(audio_transcripts))
+    fuse_stage(audio_transcripts, voiced_mask, video_texts)
+
+    book_stage()
+    segment_matches = match_stage()
+    summarize_stage(segment_matches)
+    animate_stage()
+    publish_stage(task)
+
+
+class LectureWorker:
+    """
+    Long-lived worker that loads the audio/video models once and then pulls
+    (course, lecture) tasks from a local queue, reporting per-task latency
+    separately from the one-off model load cost.
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.latencies = {}
+        self.failed = []
+        self.video_extractor = None
+        self.audio_vectorizer = None
+        self.branches = None
+
+        start = time.perf_counter()
+        if EXECUTION_MODE == "processes":
+            print("\nLoading models in the audio/video branch processes for this worker...")
+            self.branches = BranchProcesses()
+            self.branches.warm_up()
+        else:
+            from audio_embeddings import AudioVectorizer
+
+            print("\nLoading all models once for this worker... (This may take a moment)")
+            self.video_extractor = make_video_extractor()
+            self.audio_vectorizer = AudioVectorizer()
+        self.load_seconds = time.perf_counter() - start
+        print(f"Models loaded in {self.load_seconds:.1f}s")
+
+    def submit(self, task):
+        self.tasks.put(task)
+
+    def run(self, stop_when_empty=True):
+        """Process queued tasks. With stop_when_empty=False, block until a None task is queued."""
+        while True:
+            try:
+                task = self.tasks.get(block=not stop_when_empty)
+            except queue.Empty:
+                break
+            if task is None:
+                break
+
+            print(f"\n{'=' * 80}\nWorker: starting {task} ({self.tasks.qsize()} still queued)\n{'=' * 80}")
+            start = time.perf_counter()
+            try:
+                run_pipeline(task, self.video_extractor, self.audio_vectorizer, self.branches)
+            except Exception:
+                traceback.print_exc()
+                self.failed.append(task)
+            self.latencies[task] = time.perf_counter() - start
+            print(f"Worker: {task} finished in {self.latencies[task]:.1f}s (excluding model load)")
+
+        self.report()
+
+    def report(self):
+        print(f"\n--- Worker summary: {len(self.latencies)} tasks, model load {self.load_seconds:.1f}s ---")
+        for task, seconds in self.latencies.items():
+            status = "FAILED" if task in self.failed else "ok"
+            print(f"   {task}: {seconds:.1f}s [{status}]")
+        if self.latencies:
+            print(f"   Mean per-task latency: {sum(self.latencies.values()) / len(self.latencies):.1f}s")
+
+    def close(self):
+        if self.branches is not None:
+            self.branches.close()
+        else:
+            self.video_extractor.close()
+            self.audio_vectorizer.close()
+
+
 def rum_main():
+    from google_storage_code import get_course_lectures
+
     tasks = get_course_lectures(BUCKET_NAME, max_files=2)
+    worker = LectureWorker()
     for task in tasks:
-        run_pipeline(task)
+        worker.submit(task)
+    worker.run()
+    worker.close()
+
+
+def bench_startup(repeats=3):
+    """Time `pipeline.py --help` and each stage's imports in fresh interpreters."""
+    def best_of(command):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            timings.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                return None
+        return min(timings)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    rows = [("pipeline.py --help", best_of([sys.executable, os.path.join(here, "pipeline.py"), "--help"]))]
+    for stage, modules in STAGE_MODULES.items():
+        code = f"import sys; sys.path.insert(0, {here!r}); " + "; ".join(f"import {m}" for m in modules)
+        rows.append((f"{stage} imports", best_of([sys.executable, "-c", code])))
+
+    print(f"\n--- Startup time (best of {repeats}) ---")
+    for name, seconds in rows:
+        print(f"   {name:<24} {'import failed' if seconds is None else f'{seconds:.2f}s'}")
+    return rows
+
+
+def bench_detection(video_file, scales=(1.0, 0.75, 0.5), roi_frames=10, max_frames=30):
+    """
+    Time easyocr detection on up to `max_frames` frames sampled from a
+    lecture video exactly as the pipeline samples it (VIDEO_FPS, VIDEO_SCALE)
+    for each downscale factor (on the content region when roi_frames > 0),
+    and score it by box recall against full-resolution, full-frame
+    detection: the fraction of reference boxes matched by a box with IoU >= 0.5.
+    """
+    from frames_embeddings import ContentRegionFinder, detect_text_boxes
+    from model_registry import registry, get_device
+    from pipeline_functions import stream_frames_with_ffmpeg
+
+    frame_gen = stream_frames_with_ffmpeg(video_file, target_fps=VIDEO_FPS, scale=VIDEO_SCALE)
+    frames = list(itertools.islice(frame_gen, max_frames))
+    frame_gen.close()
+    if not frames:
+        return []
+    region = None
+    if roi_frames:
+        finder = ContentRegionFinder(sample_frames=roi_frames)
+        for frame in frames[:roi_frames]:
+            finder.add(frame)
+        region = finder.find()
+    print(f"Content region: {region or 'full frame'} of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    model_key = ("easyocr", "en", get_device())
+    reader = registry.acquire(*model_key)
+
+    def detect(images):
+        return [reader.readtext(image, detail=1, paragraph=False) for image in images]
+
+    def boxes(frame_detections):
+        return [[(min(x for x, _ in bbox), min(y for _, y in bbox), max(x for x, _ in bbox), max(y for _, y in bbox))
+                 for bbox, _, _ in detections] for detections in frame_detections]
+
+    def iou(a, b):
+        w = min(a[2], b[2]) - max(a[0], b[0])
+        h = min(a[3], b[3]) - max(a[1], b[1])
+        if w <= 0 or h <= 0:
+            return 0.0
+        inter = w * h
+        return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+    def timed(frame_region, scale):
+        start = time.perf_counter()
+        result = boxes(detect_text_boxes(frames, detect, frame_region, scale))
+        return result, (time.perf_counter() - start) / len(frames)
+
+    reference, reference_seconds = timed(None, 1.0)
+    rows = [("full frame, scale 1.0", reference_seconds, sum(map(len, reference)), 1.0)]
+    for scale in scales:
+        result, seconds = timed(region, scale)
+        matched = sum(any(iou(ref, box) >= 0.5 for box in found)
+                      for refs, found in zip(reference, result) for ref in refs)
+        recall = matched / max(1, sum(map(len, reference)))
+        rows.append((f"{'roi' if region else 'full frame'}, scale {scale}", seconds, sum(map(len, result)), recall))
+    registry.release(*model_key)
+
+    print(f"\n--- Text detection on {len(frames)} frames from {video_file} ---")
+    for name, seconds, num_boxes, recall in rows:
+        print(f"   {name:<24} {seconds * 1000:8.0f} ms/frame  {num_boxes:5d} boxes  recall {recall:.1%}")
+    return rows
+
+
+def check_dedup(lines=6, repeats=3):
+    """
+    Check slide dedup on a synthetic 1280x720 slide build: the slide gains
+    one line of text per step and each step is sampled `repeats` times
+    (JPEG re-encoded, as a decoder would). Every repeat must be reused and
+    every build step processed. Returns True when both hold.
+    """
+    import cv2
+    import numpy as np
+    from frames_embeddings import SlideChangeDetector
+
+    def sample(step, quality):
+        slide = np.full((720, 1280, 3), 245, np.uint8)
+        cv2.putText(slide, "Lecture title", (80, 90), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (30, 30, 30), 3)
+        for line in range(step):
+            cv2.putText(slide, f"- point {line + 1}: a bullet revealed by the build", (100, 190 + 80 * line),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (20, 20, 20), 2)
+        encoded = cv2.imencode(".jpg", slide, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+        return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    detector = SlideChangeDetector()
+    last = None
+    processed, wrongly_reused, wrongly_processed = [], [], []
+    for step in range(lines + 1):
+        for repeat in range(repeats):
+            thumbnail = detector.thumbnail(sample(step, 90 - 20 * (repeat % 3)))
+            if last is not None and detector.is_same_slide(thumbnail, last):
+                if repeat == 0:
+                    wrongly_reused.append(step)
+                continue
+            if repeat > 0:
+                wrongly_processed.append(step)
+            processed.append(step)
+            last = thumbnail
+
+    ok = not wrongly_reused and not wrongly_processed
+    print(f"\n--- Slide dedup on a {lines}-step build, {repeats} samples per step ---")
+    print(f"   processed steps: {sorted(set(processed))}")
+    if wrongly_reused:
+        print(f"   FAIL: build steps deduplicated: {wrongly_reused}")
+    if wrongly_processed:
+        print(f"   FAIL: unchanged samples re-processed at steps: {sorted(set(wrongly_processed))}")
+    print(f"   {'ok' if ok else 'failed'}")
+    return ok
+
+
+def run_all(args):
+    if args.course and args.lecture:
+        run_pipeline((args.course, args.lecture))
+        return
+    from google_storage_code import convert_dict_json_to_array_json
+    from UploadTOFrontend import run_code
+
+    rum_main()
+    convert_dict_json_to_array_json()
+    run_code()
+
+
+def load_stage_inputs():
+    with open(TRANSCRIPTS_JSON, "r", encoding="utf-8") as f:
+        transcripts = json.load(f)
+    with open(VIDEO_TEXTS_JSON, "r", encoding="utf-8") as f:
+        video_texts = json.load(f)
+    return transcripts["transcripts"], transcripts["voiced"], video_texts
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Smart Scribes lecture pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run = subparsers.add_parser("run", help="run every stage (the whole course backlog by default)")
+    run.add_argument("--course", help="only process this course (requires --lecture)")
+    run.add_argument("--lecture", help="only process this lecture (requires --course)")
+    run.set_defaults(func=run_all)
+
+    transcribe = subparsers.add_parser("transcribe", help=f"audio -> {TRANSCRIPTS_JSON}")
+    transcribe.add_argument("--audio", help="audio file (default: first file in audio_full/)")
+    transcribe.set_defaults(func=lambda args: transcribe_stage(args.audio or find_lecture_files()[0]))
+
+    frames = subparsers.add_parser("frames", help=f"video -> {VIDEO_TEXTS_JSON}")
+    frames.add_argument("--video", help="video file (default: first file in video_full/)")
+    frames.set_defaults(func=lambda args: frames_stage(args.video or find_lecture_files()[1]))
+
+    stream = subparsers.add_parser("stream", help=f"streaming transcribe + frames -> {TRANSCRIPTS_JSON}, {VIDEO_TEXTS_JSON}")
+    stream.add_argument("--audio", help="audio file (default: first file in audio_full/)")
+    stream.add_argument("--video", help="video file (default: first file in video_full/)")
+    stream.set_defaults(func=lambda args: streaming_stage(args.audio or find_lecture_files()[0],
+                                                          args.video or find_lecture_files()[1]))
+
+    fuse = subparsers.add_parser("fuse", help=f"embed and fuse into {FULL_JSON} and .npy files")
+    fuse.set_defaults(func=lambda args: fuse_stage(*load_stage_inputs()))
+
+    book = subparsers.add_parser("book", help="chunk and embed the course book")
+    book.add_argument("--pdf", default=BOOK_PDF)
+    book.add_argument("--name", default=BOOK_NAME)
+    book.set_defaults(func=lambda args: book_stage(args.pdf, args.name))
+
+    match = subparsers.add_parser("match", help="match lecture segments with book chunks")
+    match.set_defaults(func=lambda args: match_stage())
+
+    summarize = subparsers.add_parser("summarize", help="generate all_data.txt and final.json")
+    summarize.set_defaults(func=lambda args: summarize_stage())
+
+    animate = subparsers.add_parser("animate", help="generate manim animations")
+    animate.set_defaults(func=lambda args: animate_stage())
+
+    publish = subparsers.add_parser("publish", help="merge, upload and push to the frontend")
+    publish.add_argument("--course", required=True)
+    publish.add_argument("--lecture", required=True)
+    publish.set_defaults(func=lambda args: publish_stage((args.course, args.lecture)))
+
+    bench_det = subparsers.add_parser("bench-detection", help="benchmark detection speed/recall per downscale factor")
+    bench_det.add_argument("--video", help="lecture video to sample (default: first file in video_full/)")
+    bench_det.add_argument("--max-frames", type=int, default=30)
+    bench_det.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5])
+    bench_det.add_argument("--roi-frames", type=int, default=10, help="0 benchmarks on the whole frame")
+    bench_det.set_defaults(func=lambda args: bench_detection(args.video or find_lecture_files()[1], args.scales,
+                                                             args.roi_frames, args.max_frames))
+
+    check = subparsers.add_parser("check-dedup", help="check slide dedup keeps every step of a slide build")
+    check.add_argument("--lines", type=int, default=6)
+    check.set_defaults(func=lambda args: sys.exit(0 if check_dedup(args.lines) else 1))
+
+    bench = subparsers.add_parser("bench-startup", help="benchmark CLI and per-stage import time")
+    bench.add_argument("--repeats", type=int, default=3)
+    bench.set_defaults(func=lambda args: bench_startup(args.repeats))
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(["run"])
+    if args.command == "run" and bool(args.course) != bool(args.lecture):
+        parser.error("run: --course and --lecture must be given together")
+    args.func(args)
+
 
-rum_main()
-convert_dict_json_to_array_json()
-run_code()
+if __name__ == "__main__":
+    main()
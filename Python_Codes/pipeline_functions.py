@@ -1,4 +1,3 @@
-import cv2
 import subprocess  # To run terminal commands
 import os          # To create/manage folders
 import shutil      # To delete the temporary folder
@@ -6,6 +5,10 @@ import glob
 from pathlib import Path      # To find all the frame files
 import re
 import json
+import numpy as np
+
+FFMPEG_PATH = 'C:/ffmpeg-master-latest-win64-gpl-shared/bin/ffmpeg.exe' # make the path change here
+FFPROBE_PATH = 'C:/ffmpeg-master-latest-win64-gpl-shared/bin/ffprobe.exe' # make the path change here
 
 def preprocess_video_with_ffmpeg(video_path, target_fps=2.0, output_folder="frames_temp"):
     """
@@ -21,7 +24,7 @@ def preprocess_video_with_ffmpeg(video_path, target_fps=2.0, output_folder="fram
     print(f"Creating new temp folder: {output_folder}")
     os.makedirs(output_folder)
     command = [
-    'C:/ffmpeg-master-latest-win64-gpl-shared/bin/ffmpeg.exe', # make the path change here,
+    FFMPEG_PATH,
     "-i", video_path,
     "-filter:v", f"fps={target_fps}",
     os.path.join(output_folder, "frame_%05d.png")  # Use frames_temp/frame_00001.png etc.
@@ -36,6 +39,8 @@ def load_frames_from_folder(folder_path):
     """
     Generator to read all .png frames from a folder created by FFmpeg.
     """
+    import cv2
+
     frame_files = sorted(glob.glob(f"{folder_path}/*.png"))
     
     if not frame_files:
@@ -51,6 +56,70 @@ def load_frames_from_folder(folder_path):
         else:
             print(f"Warning: Could not read frame {file_path}")
 
+def probe_video_size(video_path):
+    """Return (width, height) of the first video stream using ffprobe."""
+    command = [
+        FFPROBE_PATH,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=p=0:s=x",
+        video_path
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip()
+    width, height = output.splitlines()[0].split("x")[:2]
+    return int(width), int(height)
+
+def stream_frames_with_ffmpeg(video_path, target_fps=2.0, scale=1.0):
+    """
+    Generator that decodes frames at `target_fps` (optionally resized by `scale`)
+    and yields them as BGR uint8 numpy arrays read straight from an FFmpeg pipe,
+    with no PNG encode/decode or temp folder.
+    """
+    width, height = probe_video_size(video_path)
+    if scale != 1.0:
+        width = max(2, int(width * scale) // 2 * 2)
+        height = max(2, int(height * scale) // 2 * 2)
+    print(f"Streaming video frames with FFmpeg. Target FPS: {target_fps}, size: {width}x{height}")
+
+    command = [
+        FFMPEG_PATH,
+        "-loglevel", "error",
+        "-i", video_path,
+        "-vf", f"fps={target_fps},scale={width}:{height}",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "pipe:1"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_bytes = width * height * 3
+    try:
+        while True:
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            buffer = memoryview(frame).cast("B")
+            read = 0
+            while read < frame_bytes:
+                n = process.stdout.readinto(buffer[read:])
+                if not n:
+                    break
+                read += n
+            if read < frame_bytes:
+                break
+            yield frame
+    except GeneratorExit:
+        # Closed early by the consumer: ffmpeg is still decoding, so stop it
+        process.kill()
+        raise
+    finally:
+        # At EOF ffmpeg may still be shutting down; wait for it instead of killing it
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="ignore")
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        print("FFmpeg stderr:", stderr)
+        raise IOError(f"FFmpeg failed to decode {video_path}.")
+
 def create_batches(frame_generator, batch_size):
     batch = []
     for frame in frame_generator:
@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+import traceback
+
+_DONE = object()
+
+
+class StageMetrics:
+    """Queue-depth samples and busy time for one stage's input queue."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def sample(self, depth):
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    @property
+    def depth_mean(self):
+        return self.depth_total / self.depth_samples if self.depth_samples else 0.0
+
+
+class BoundedPipeline:
+    """
+    Chain of stages connected by bounded queues, each stage running in its own
+    worker thread. A full queue blocks the stage feeding it, so at most
+    `max_queue` items wait between any two stages and memory stays bounded
+    however long the input is. Stages run one item at a time in order, so
+    outputs come out in source order.
+
+    A monitor thread samples every queue's depth each `sample_interval`
+    seconds; report() prints the per-stage depth and busy-time metrics.
+    """
+
+    def __init__(self, name, max_queue=4, sample_interval=0.5):
+        self.name = name
+        self.max_queue = max_queue
+        self.sample_interval = sample_interval
+        self.stages = []
+        self.metrics = []
+        self.error = None
+        self._stop = threading.Event()
+
+    def add_stage(self, name, fn):
+        """Add a stage calling fn(item) -> item for every item flowing through."""
+        self.stages.append((name, fn))
+        self.metrics.append(StageMetrics(name))
+        return self
+
+    def run(self, source):
+        """Feed `source` through all stages; yields the last stage's outputs in order."""
+        queues = [queue.Queue(maxsize=self.max_queue) for _ in range(len(self.stages) + 1)]
+        stop_monitor = threading.Event()
+        self.error = None
+        self._stop.clear()
+
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), name=f"{self.name}-source", daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._work, args=(fn, queues[i], queues[i + 1], self.metrics[i]),
+                name=f"{self.name}-{name}", daemon=True
+            ))
+        monitor = threading.Thread(target=self._monitor, args=(queues[:-1], stop_monitor), daemon=True)
+
+        for thread in threads:
+            thread.start()
+        monitor.start()
+        finished = False
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    finished = True
+                    break
+                yield item
+        finally:
+            if not finished:
+                # Consumer stopped early: tell the stages to drain and wait for them to wind down
+                self._stop.set()
+                while queues[-1].get() is not _DONE:
+                    pass
+            stop_monitor.set()
+            for thread in threads:
+                thread.join()
+            monitor.join()
+
+        if self.error is not None:
+            raise RuntimeError(f"{self.name} pipeline stage failed") from self.error
+
+    def _feed(self, source, outbox):
+        try:
+            for item in source:
+                if self._stop.is_set():
+                    break
+                outbox.put(item)
+        except Exception as e:
+            self._fail(e)
+        outbox.put(_DONE)
+
+    def _work(self, fn, inbox, outbox, metrics):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                outbox.put(_DONE)
+                return
+            if self._stop.is_set():
+                continue  # keep draining so upstream stages never block on a full queue
+            start = time.perf_counter()
+            try:
+                result = fn(item)
+            except Exception as e:
+                self._fail(e)
+                continue
+            metrics.busy_seconds += time.perf_counter() - start
+            metrics.items += 1
+            outbox.put(result)
+
+    def _fail(self, error):
+        if self.error is None:
+            traceback.print_exc()
+            self.error = error
+        self._stop.set()
+
+    def _monitor(self, queues, stop):
+        while not stop.wait(self.sample_interval):
+            for q, metrics in zip(queues, self.metrics):
+                metrics.sample(q.qsize())
+
+    def report(self):
+        print(f"\n--- {self.name} pipeline: per-stage queue depth (max {self.max_queue}) ---")
+        for metrics in self.metrics:
+            print(f"   {metrics.name:<12} items={metrics.items:<5} busy={metrics.busy_seconds:7.1f}s "
+                  f"queue mean={metrics.depth_mean:4.1f} max={metrics.depth_max}")